@@ -1,11 +1,45 @@
 [model]
-method = option('em', 'lda', 'lsa')
+method = option('em', 'lda', 'lsa', 'ensemble')
 debug = boolean(default=False)
 show_viz = boolean(default=False)
 datasource = string
+load_model = string(default='')
+min_fit = float(min=0.0, max=1.0, default=0.5)
 
 [em_conf]
 viz_count = integer(default=4)
 topic_count = integer(default=4)
 iterations = integer(default=250)
 save_model = boolean(default=False)
+export_model = string(default='')
+quantize = option('int8', 'float16', 'float32', 'float64', default='int8')
+checkpoint_path = string(default='')
+checkpoint_interval = integer(min=0, default=0)
+resume = boolean(default=False)
+
+[vocab]
+min_df = integer(min=1, default=1)
+max_df = float(min=0.0, max=1.0, default=1.0)
+hash_buckets = integer(min=0, default=0)
+
+[lsa_conf]
+backend = option('gensim', 'rsvd', default='gensim')
+tfidf = boolean(default=True)
+
+[ensemble_conf]
+methods = force_list(default=list('em', 'lda', 'lsa'))
+weights = float_list(default=list())
+voting = option('majority', 'weighted', default='weighted')
+
+[cache]
+enabled = boolean(default=False)
+path = string(default='./processed/query_cache.sqlite')
+max_size = integer(min=0, default=16777216)
+
+[backtest]
+methods = force_list(default=list('em', 'lda', 'lsa'))
+topic_counts = int_list(default=list(4))
+folds = integer(min=2, default=5)
+workers = integer(min=0, default=0)
+tolerance = integer(min=0, default=1)
+memory = boolean(default=False)
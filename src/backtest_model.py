@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Usage:
+    backtest_model.py [--help] [--debug] [--folds=<folds>] [--workers=<workers>] [--tolerance=<hours>] [--min-fit=<ratio>] [--iterations=<num_iterations>] [--seed=<seed>] [--no-tfidf] [--memory] [--min-df=<count>] [--max-df=<fraction>] [--hash-buckets=<buckets>] <training_metads_file> <methods> <topic_counts>
+
+Options:
+  --folds=<folds>         number of k-fold splits of the historical events
+  --workers=<workers>     number of worker processes (default: cpu count)
+  --tolerance=<hours>     hours either side of the actual start hour counted as near
+  --min-fit=<ratio>       fit (share of events lasting the duration) an hour needs to be preferred (default: 0.5)
+  --iterations=<num_iterations>    number of EM iterations
+  --seed=<seed>           seed for shuffling events into folds
+  --no-tfidf              do not weight counts by inverse document frequency (lsa_rsvd method)
+  --memory                trace peak memory allocated while fitting (slows fitting down)
+  --min-df=<count>        prune tokens appearing in fewer training events (default: 1)
+  --max-df=<fraction>     prune tokens appearing in a larger fraction of training events (default: 1.0)
+  --hash-buckets=<buckets>    hash tokens into a fixed number of buckets (default: 0, no hashing)
+
+Arguments:
+  <training_metads_file>  filename with emtopic training metadata (in JSON)
+  <methods>               comma separated topic modeling algorithms (em,lda,lsa,lsa_rsvd)
+  <topic_counts>          comma separated topic cluster counts to evaluate
+
+Options:
+  -h, --help    Show this screen and exit.
+  --debug       Set debug flag for more output
+"""
+import sys
+import os
+import time
+import tracemalloc
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from docopt import docopt
+from typing import Dict, List, Tuple, Any
+
+sys.path.insert(1, './lib')
+import EventIntervalIndex as evii
+import Vocabulary as vocabm
+import gen_em_model as gem
+import LdaLsaTopicModel as ldalsatm
+
+DEFAULT_NUM_FOLDS = 5
+DEFAULT_TOLERANCE = 1
+DEFAULT_SEED = 12345
+NUM_DECISIONS = 2
+HOURS_PER_DAY = 24
+
+# historical records and fold assignments shared with every worker process
+_records = []
+_folds = []
+
+
+def init_worker(records: List[Dict[str, Any]], folds: List[np.ndarray], preload_gensim: bool = False):
+    """
+    Share the historical records and fold assignments with a worker process (once per worker).
+
+    Parameters:
+    - records (List[Dict[str, Any]]): Flattened historical event records.
+    - folds (List[np.ndarray]): Record indices held out by each fold.
+    - preload_gensim (bool): Whether to import gensim now, so its import isn't timed (or traced) as
+    part of the worker's first lda/lsa fit. Defaults to False.
+    """
+    global _records, _folds
+    _records = records
+    _folds = folds
+
+    if preload_gensim is True:
+        ldalsatm.preload_gensim()
+
+
+def hour_distance(hour_a: int, hour_b: int) -> int:
+    """
+    Distance in hours between two hours of the day, wrapping around midnight.
+
+    Parameters:
+    - hour_a (int): First hour of the day.
+    - hour_b (int): Second hour of the day.
+
+    Returns:
+    - int: The distance in hours (0-12).
+    """
+    diff = abs(int(hour_a) - int(hour_b)) % HOURS_PER_DAY
+    return min(diff, HOURS_PER_DAY - diff)
+
+
+def split_folds(num_records: int, folds: int, seed: int = DEFAULT_SEED) -> List[np.ndarray]:
+    """
+    Shuffle record indices and split them into k folds.
+
+    Parameters:
+    - num_records (int): The number of historical records.
+    - folds (int): The number of folds.
+    - seed (int): Seed for shuffling. Defaults to DEFAULT_SEED.
+
+    Returns:
+    - List[np.ndarray]: Record indices held out by each fold.
+    """
+    np_rand = np.random.RandomState(seed=seed)
+    return np.array_split(np_rand.permutation(num_records), folds)
+
+
+def training_metadata(records: List[Dict[str, Any]], held_out: np.ndarray) -> List[List[Dict[str, Any]]]:
+    """
+    Get the metadata a fold's model is fit on: every record but the held-out ones.
+
+    Parameters:
+    - records (List[Dict[str, Any]]): Flattened historical event records.
+    - held_out (np.ndarray): Record indices held out by the fold.
+
+    Returns:
+    - List[List[Dict[str, Any]]]: The training metadata (a single grouping).
+    """
+    held_out_set = set(held_out.tolist())
+    return [[rec for idx, rec in enumerate(records) if idx not in held_out_set]]
+
+
+def run_fold(model_type: str, topics: int, fold_idx: int, iterations: int, tolerance: int,
+             lsa_tfidf: bool = True, memory: bool = False, vocab_conf: Dict[str, Any] = None,
+             min_fit: float = gem.DEFAULT_MIN_FIT, debug: bool = False) -> Dict[str, Any]:
+    """
+    Fit a model on all but one fold and query it with every held-out event.
+
+    Parameters:
+    - model_type (str): Topic modeling algorithm (em|lda|lsa|lsa_rsvd).
+    - topics (int): The number of topic clusters.
+    - fold_idx (int): The fold held out for querying.
+    - iterations (int): The number of EM iterations.
+    - tolerance (int): Hours either side of the actual start hour counted as near.
+    - lsa_tfidf (bool): Whether randomized SVD LSA weights counts by idf. Defaults to True.
+    - memory (bool): Whether to trace peak memory allocated while fitting. Defaults to False.
+    - vocab_conf (Dict[str, Any]): min_df, max_df and hash_buckets of the vocabulary built from the
+    training events. Defaults to None (unbounded).
+    - min_fit (float): Fit an hour needs to be preferred. Defaults to gem.DEFAULT_MIN_FIT.
+    - debug (bool): Flag to print debug information. Defaults to False.
+
+    Returns:
+    - Dict[str, Any]: Hit and near counts per decision, query count, fit and total query seconds,
+    and peak fit memory in bytes (0 unless traced).
+    """
+    held_out = _folds[fold_idx]
+    metadata = training_metadata(_records, held_out)
+
+    if memory is True:
+        tracemalloc.start()
+
+    fit_start = time.perf_counter()
+    interval_index = evii.build_interval_index(metadata)
+    vocab = vocabm.build_vocabulary(metadata, **(vocab_conf or {}))
+    metadata = vocabm.apply_vocabulary(vocab, metadata)
+    ordered_tokens, dt_token_group_counts, X = gem.transform_metadata_uci(metadata)
+    model = gem.fit_topic_model(model_type, metadata, X, topics, iterations=iterations, lsa_tfidf=lsa_tfidf)
+    fit_secs = time.perf_counter() - fit_start
+
+    fit_peak = 0
+    if memory is True:
+        _, fit_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    hits = [0] * NUM_DECISIONS
+    nears = [0] * NUM_DECISIONS
+    query_secs = 0.0
+
+    for idx in held_out:
+        record = _records[idx]
+        actual_hour = record['start_dp'] // 100
+
+        query_start = time.perf_counter()
+        new_tokens = gem.emtopic_tokens_from_event(' '.join(record['tokens']))
+        new_tokens = vocabm.map_tokens(vocab, new_tokens)
+        weights = gem.query_topic_model(model_type, model, ordered_tokens, new_tokens)
+        suggestions = gem.suggest_hour_ops_by_tokens(new_tokens, ordered_tokens, dt_token_group_counts, weights,
+                                                     interval_index=interval_index, duration=record['dur_dp'],
+                                                     min_fit=min_fit)
+        query_secs += time.perf_counter() - query_start
+
+        for i, suggestion in enumerate(suggestions):
+            hour = suggestion[1][0]
+            if not np.isfinite(hour):
+                continue
+            hits[i] += int(hour == actual_hour)
+            nears[i] += int(hour_distance(hour, actual_hour) <= tolerance)
+
+    if debug is True:
+        sys.stderr.write(f"{model_type} topics={topics} fold={fold_idx}: fit {fit_secs:.3f}s "
+                         f"queries {len(held_out)} in {query_secs:.3f}s\n")
+
+    return {
+        'hits': hits,
+        'nears': nears,
+        'queries': len(held_out),
+        'fit_secs': fit_secs,
+        'fit_peak': fit_peak,
+        'query_secs': query_secs,
+    }
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the per-fold results of one method and topic count.
+
+    Parameters:
+    - results (List[Dict[str, Any]]): Results from run_fold.
+
+    Returns:
+    - Dict[str, Any]: Accuracy per decision, mean fit seconds, mean query milliseconds and the largest
+    peak fit memory in megabytes.
+    """
+    queries = sum(result['queries'] for result in results)
+    summary = {
+        'queries': queries,
+        'fit_secs': np.mean([result['fit_secs'] for result in results]),
+        'fit_peak_mb': max(result['fit_peak'] for result in results) / (1024.0 * 1024.0),
+        'query_ms': 1000.0 * sum(result['query_secs'] for result in results) / max(queries, 1),
+    }
+    for i in range(NUM_DECISIONS):
+        summary[f'hit{i + 1}'] = sum(result['hits'][i] for result in results) / max(queries, 1)
+        summary[f'near{i + 1}'] = sum(result['nears'][i] for result in results) / max(queries, 1)
+
+    return summary
+
+
+def print_report(summaries: Dict[Tuple[str, int], Dict[str, Any]], folds: int, tolerance: int,
+                 memory: bool = False):
+    """
+    Print accuracy and latency for every evaluated method and topic count.
+
+    Parameters:
+    - summaries (Dict[Tuple[str, int], Dict[str, Any]]): Summaries keyed by (method, topic count).
+    - folds (int): The number of folds.
+    - tolerance (int): Hours either side of the actual start hour counted as near.
+    - memory (bool): Whether to report the peak fit memory. Defaults to False.
+    """
+    print(f"Backtest: {folds} folds, near = within {tolerance} hour(s) of actual DTSTART hour")
+    print(f"{'Method':<8}{'Topics':>7}{'Queries':>9}{'D1 Hit':>8}{'D1 Near':>9}{'D2 Hit':>8}{'D2 Near':>9}"
+          f"{'Fit (s)':>10}{'Query (ms)':>12}" + (f"{'Fit (MB)':>10}" if memory else ""))
+    for (model_type, topics), summary in summaries.items():
+        print(f"{model_type.upper():<8}{topics:>7}{summary['queries']:>9}"
+              f"{summary['hit1']:>8.3f}{summary['near1']:>9.3f}{summary['hit2']:>8.3f}{summary['near2']:>9.3f}"
+              f"{summary['fit_secs']:>10.3f}{summary['query_ms']:>12.3f}" +
+              (f"{summary['fit_peak_mb']:>10.2f}" if memory else ""))
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    tsdata = args['<training_metads_file>']
+    methods = [method.strip() for method in args['<methods>'].split(',') if method.strip()]
+    debug = args['--debug'] or False
+    lsa_tfidf = not args['--no-tfidf']
+    memory = args['--memory'] or False
+
+    try:
+        topic_counts = [int(count) for count in args['<topic_counts>'].split(',')]
+    except ValueError:
+        sys.stderr.write("Error: '<topic_counts>' needs to be comma separated integers\n")
+        sys.exit(1)
+
+    try:
+        folds = int(args['--folds'])
+    except Exception:
+        folds = DEFAULT_NUM_FOLDS
+
+    try:
+        workers = int(args['--workers'])
+    except Exception:
+        workers = os.cpu_count()
+
+    try:
+        tolerance = int(args['--tolerance'])
+    except Exception:
+        tolerance = DEFAULT_TOLERANCE
+
+    try:
+        min_fit = float(args['--min-fit'])
+    except Exception:
+        min_fit = gem.DEFAULT_MIN_FIT
+
+    try:
+        iterations = int(args['--iterations'])
+    except Exception:
+        iterations = gem.DEFAULT_NUM_ITERATIONS
+
+    try:
+        seed = int(args['--seed'])
+    except Exception:
+        seed = DEFAULT_SEED
+
+    try:
+        min_df = int(args['--min-df'])
+    except Exception:
+        min_df = vocabm.DEFAULT_MIN_DF
+
+    try:
+        max_df = float(args['--max-df'])
+    except Exception:
+        max_df = vocabm.DEFAULT_MAX_DF
+
+    try:
+        hash_buckets = int(args['--hash-buckets'])
+    except Exception:
+        hash_buckets = vocabm.DEFAULT_HASH_BUCKETS
+
+    vocab_conf = {'min_df': min_df, 'max_df': max_df, 'hash_buckets': hash_buckets}
+
+    metadata = gem.get_metadata(tsdata)
+    records = [record for grouping in metadata for record in grouping if len(record['tokens']) > 0]
+
+    if folds < 2 or folds > len(records):
+        sys.stderr.write(f"Error: '--folds' needs to be between 2 and {len(records)}\n")
+        sys.exit(1)
+
+    fold_idxs = split_folds(len(records), folds, seed=seed)
+
+    # every fold builds its vocabulary from its own training events only
+    for fold_idx, held_out in enumerate(fold_idxs):
+        vocab = vocabm.build_vocabulary(training_metadata(records, held_out), **vocab_conf)
+        if vocab['keep'] is not None and len(vocab['keep']) == 0:
+            sys.stderr.write(f"Error: '--min-df={min_df}' and '--max-df={max_df}' prune every token "
+                             f"(training events of fold {fold_idx})\n")
+            sys.exit(1)
+    tasks = [(model_type, topics) for model_type in methods for topics in topic_counts]
+    preload_gensim = any(model_type in ldalsatm.GENSIM_METHODS for model_type in methods)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(records, fold_idxs, preload_gensim)) as executor:
+        futures = {
+            task: [executor.submit(run_fold, task[0], task[1], fold_idx, iterations, tolerance,
+                                   lsa_tfidf, memory, vocab_conf, min_fit, debug)
+                   for fold_idx in range(folds)]
+            for task in tasks
+        }
+        summaries = {task: summarize([future.result() for future in task_futures])
+                     for task, task_futures in futures.items()}
+
+    print_report(summaries, folds, tolerance, memory)
@@ -12,12 +12,13 @@ python3<<! && echo $DS_FULLPATH
 import json
 import re
 import os
+import sys
 import math
 import numpy as np
 
 from os import listdir, environ
 from os.path import isfile, join, basename
-from datetime import datetime, timedelta
+from itertools import chain
 from uuid import uuid4
 
 class EmException(BaseException):
@@ -101,12 +102,41 @@ TOKEN_IGNORE = [
 'but',
 ]
 
-SCHEDULES_HISTDIR = './raw'
+SCHEDULES_HISTDIR = environ.get('_SCHEDULES_HISTDIR', './raw')
 SCHEDULES_DTFORMAT = '%Y%m%dT%H%M%S'
+SCHEDULES_DTLEN = 15
+SCHEDULES_DTSEP_POS = 8
+# UTC values carry a trailing 'Z'; DATE values (all-day events) are only
+# the date part and start at midnight
+SCHEDULES_DTUTC_SUFFIX = 'Z'
+SCHEDULES_DATELEN = 8
+SCHEDULES_DATE_MIDNIGHT = 'T000000'
+SCHEDULES_DTINVALID = '0' * SCHEDULES_DTLEN
+# (position, width) of year, month, day, hour, minute, second in the
+# digits of SCHEDULES_DTFORMAT once the 'T' separator is dropped
+SCHEDULES_DTFIELDS = ((0, 4), (4, 2), (6, 2), (8, 2), (10, 2), (12, 2))
+SCHEDULES_HOURS_PER_DAY = 24
+SCHEDULES_HOURS = np.arange(SCHEDULES_HOURS_PER_DAY)
 SCHEDULES_DTSTART_KEYREGEX = re.compile(r'^(DTSTART.*)$')
 SCHEDULES_DTEND_KEYREGEX = re.compile(r'^(DTEND.*)$')
+SCHEDULES_SUMMARY_KEYREGEX = re.compile(r'^(SUMMARY(;.*)?)$')
+SCHEDULES_DURATION_KEYREGEX = re.compile(r'^(DURATION(;.*)?)$')
+# rfc5545 durations, e.g. 'P1W', 'P1DT2H', 'PT90M'; weeks, days, hours,
+# minutes and seconds in seconds
+SCHEDULES_DURATION_REGEX = re.compile(r'^P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+SCHEDULES_DURATION_SECS = (7 * 86400, 86400, 3600, 60, 1)
+SCHEDULES_DURATION_NONE = -1
 SCHEDULES_REQUESTID_REGEX = re.compile(r'\#([0-9]+)')
 
+# ics content lines are NAME[;PARAM=VALUE...]:VALUE where parameter values
+# may be quoted and contain ':'
+SCHEDULES_ICS_EXTENSION = '.ics'
+SCHEDULES_ICS_CONTENTLINE_REGEX = re.compile(r'^((?:[^":]|"[^"]*")*):(.*)$')
+SCHEDULES_ICS_FOLD_CHARS = (' ', '\t')
+SCHEDULES_ICS_ESCAPE_CHAR = chr(92)
+SCHEDULES_ICS_BEGIN = 'BEGIN:'
+SCHEDULES_ICS_END = 'END:'
+
 TOKEN_IGNORE_REGEX = re.compile('|'.join(TOKEN_IGNORE), re.I)
 
 def get_sched_files():
@@ -161,32 +191,6 @@ def get_emtopic_tokens_from_event(event_summary, minlen=3):
     # finally, return the list of tokens from the summary
     return event_summary.split(' ')
 
-def get_hours_operational(startdt, enddt):
-    hour_span = 1
-    hour = timedelta(hours=1)
-    next_hourdt = startdt
-
-    hour_ops = [startdt.hour]
-
-    if enddt > startdt:
-        time_delta = enddt - startdt
-        time_delta_hours = time_delta.seconds/3600.0
-
-        for i in range(int(time_delta_hours)):
-            next_hourdt += hour
-            hour_counter = next_hourdt.hour
-            if enddt.hour != next_hourdt.hour:
-                hour_ops.append(hour_counter)
-
-        if startdt.hour != enddt.hour:
-            if enddt.hour not in hour_ops:
-                if enddt.minute > 0:
-                    hour_ops.append(enddt.hour)
-
-        #hour_ops[-1] = math.floor(np.mean(hour_ops))
-
-    return list(hour_ops)
-
 def get_dtend_key(key_list):
     dtend_key = None
     for k in key_list:
@@ -196,65 +200,185 @@ def get_dtend_key(key_list):
             break
     return dtend_key
 
-def get_emtopic_metadata_from_event(event, dtstart_key, dtend_key):
-    start_dp = None
-    end_dp = None
-    dur_dp = None
-    hour_ops_dp = []
-    event_meta = {}
+def get_summary_key(key_list):
+    summary_key = None
+    for k in key_list:
+        key_check = SCHEDULES_SUMMARY_KEYREGEX.search(k)
+        if key_check:
+            summary_key = key_check.group(1)
+            break
+    return summary_key
+
+def get_duration_key(key_list):
+    duration_key = None
+    for k in key_list:
+        key_check = SCHEDULES_DURATION_KEYREGEX.search(k)
+        if key_check:
+            duration_key = key_check.group(1)
+            break
+    return duration_key
 
+def get_event_dt_values(event, dtstart_key, dtend_key):
     try:
-        startdt = datetime.strptime(
-                    event[dtstart_key],
-                    SCHEDULES_DTFORMAT
-                  )
-        enddt = datetime.strptime(
-                  event[dtend_key],
-                  SCHEDULES_DTFORMAT
-                )
-        duration = enddt - startdt
-
-        start_dp = int(startdt.strftime('%H%M'))
-        end_dp = int(enddt.strftime('%H%M'))
-        dur_dp = int(duration.total_seconds() / 60)
-        hour_ops_dp = get_hours_operational(startdt, enddt)
+        return (event[dtstart_key], event[dtend_key])
     except KeyError:
-        # try one last time to get a valid set of dt keys
-        dtstart_key = get_dtstart_key(event.keys())
-        dtend_key = get_dtend_key(event.keys())
-
-        startdt = datetime.strptime(
-                    event[dtstart_key],
-                    SCHEDULES_DTFORMAT
-                  )
-        enddt = datetime.strptime(
-                  event[dtend_key],
-                  SCHEDULES_DTFORMAT
-                )
-        duration = enddt - startdt
-
-        start_dp = int(startdt.strftime('%H%M'))
-        end_dp = int(enddt.strftime('%H%M'))
-        dur_dp = int(duration.total_seconds() / 60)
-        hour_ops_dp = get_hours_operational(startdt, enddt)
-    except Exception as err:
-        raise EmException("BUG: inputs not processed as expected: exception: {err}".format(err=err))
-
-    request_id = get_request_id_from_event(event['SUMMARY'])
-    tokens = get_emtopic_tokens_from_event(event['SUMMARY'])
-    tokens = [tok for tok in tokens if len(tok) > 0]
-
-    event_meta['request_id'] = request_id
-    event_meta['start_dp'] = start_dp
-    event_meta['end_dp'] = end_dp
-    event_meta['dur_dp'] = dur_dp
-    event_meta['tokens'] = tokens
-    event_meta['hour_ops'] = hour_ops_dp
-
-    return event_meta
-    
-def get_data_from_json(sched_file):
+        # try one last time to get a valid set of dt keys; an event
+        # given a DURATION instead of a DTEND gets an empty DTEND (see
+        # get_event_duration)
+        try:
+            dtstart = event[get_dtstart_key(event.keys())]
+            dtend_key = get_dtend_key(event.keys())
+            if dtend_key is None and get_duration_key(event.keys()) is not None:
+                return (dtstart, '')
+            return (dtstart, event[dtend_key])
+        except KeyError as err:
+            raise EmException("BUG: inputs not processed as expected: missing dt key: {err}".format(err=err))
+
+def get_event_duration(event):
+    # seconds of the event's DURATION, or SCHEDULES_DURATION_NONE when
+    # it has none (or one that can't be parsed, e.g. a negative one)
+    duration_key = get_duration_key(event.keys())
+    if duration_key is None:
+        return SCHEDULES_DURATION_NONE
+
+    duration_check = SCHEDULES_DURATION_REGEX.search(event[duration_key].strip())
+    if not duration_check or not any(duration_check.groups()):
+        return SCHEDULES_DURATION_NONE
+    return sum(
+             int(value) * secs \
+               for (value, secs) in zip(duration_check.groups(), SCHEDULES_DURATION_SECS) \
+                 if value is not None
+           )
+
+def normalize_sched_datetime(dt_value):
+    # bring UTC and DATE values to SCHEDULES_DTFORMAT; UTC values keep
+    # their clock time, as TZID ones do. Anything else of the wrong
+    # length maps to SCHEDULES_DTINVALID, which fails parsing
+    dt_value = dt_value.strip()
+    if len(dt_value) == SCHEDULES_DTLEN + 1 and dt_value.endswith(SCHEDULES_DTUTC_SUFFIX):
+        dt_value = dt_value[:-1]
+    elif len(dt_value) == SCHEDULES_DATELEN:
+        dt_value = dt_value + SCHEDULES_DATE_MIDNIGHT
+
+    if len(dt_value) != SCHEDULES_DTLEN or not dt_value.isascii():
+        return SCHEDULES_DTINVALID
+    return dt_value
+
+def parse_sched_datetimes(dt_values):
+    # parse SCHEDULES_DTFORMAT ('%Y%m%dT%H%M%S') strings in bulk by
+    # fixed character positions into datetime64[s]; returns the
+    # datetimes and a mask of the values that parsed (the datetimes of
+    # the others are meaningless)
+    dt_raw = np.array([normalize_sched_datetime(dt_value) for dt_value in dt_values],
+                      dtype='S{n}'.format(n=SCHEDULES_DTLEN))
+
+    dt_chars = dt_raw.view(np.uint8).reshape(-1, SCHEDULES_DTLEN).astype(np.int64)
+    dt_digits = np.delete(dt_chars, SCHEDULES_DTSEP_POS, axis=1) - ord('0')
+    valid = (dt_chars[:, SCHEDULES_DTSEP_POS] == ord('T')) & \
+              np.all((dt_digits >= 0) & (dt_digits <= 9), axis=1)
+    dt_digits = np.where(valid[:, None], dt_digits, 0)
+
+    (year, month, day, hour, minute, second) = (
+        dt_digits[:, pos:pos+width] @ (10 ** np.arange(width - 1, -1, -1)) \
+          for (pos, width) in SCHEDULES_DTFIELDS
+    )
+
+    month_start = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days_in_month = ((month_start + 1).astype('datetime64[D]') - month_start.astype('datetime64[D]')).astype(np.int64)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month) & \
+               (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    dtimes = month_start.astype('datetime64[s]') + \
+               ((day - 1) * 86400 + hour * 3600 + minute * 60 + second).astype('timedelta64[s]')
+    return (dtimes, valid)
+
+def get_hours_operational(startdts, enddts):
+    # every hour of the day touched by [start, end) at minute resolution,
+    # in chronological order from the start hour; spans of a day or more
+    # cover all hours
+    start_mins = startdts.astype('datetime64[m]').astype(np.int64)
+    end_mins = enddts.astype('datetime64[m]').astype(np.int64)
+    first_hours = start_mins // 60
+
+    hour_spans = -((first_hours * 60 - end_mins) // 60)
+    hour_spans = np.clip(hour_spans, 1, SCHEDULES_HOURS_PER_DAY)
+
+    # (events x hours) of the hours from each start hour, cut to its span
+    start_hours = first_hours % SCHEDULES_HOURS_PER_DAY
+    chrono_hours = (start_hours[:, None] + SCHEDULES_HOURS) % SCHEDULES_HOURS_PER_DAY
+    return [
+        hours[:span] \
+          for (hours, span) in zip(chrono_hours.tolist(), hour_spans.tolist())
+        ]
+
+def get_emtopic_metadata_from_events(sched_events, dtstart_key, dtend_key):
+    summaries = []
+    dtstarts = []
+    dtends = []
+    durations = []
+
+    for sched_event in sched_events:
+        try:
+            (dtstart, dtend) = get_event_dt_values(sched_event, dtstart_key, dtend_key)
+        except EmException:
+            # reported (and dropped) below with the unparsable datetimes
+            (dtstart, dtend) = ('', '')
+        summaries.append(sched_event.get(get_summary_key(sched_event.keys()), ''))
+        dtstarts.append(dtstart)
+        dtends.append(dtend)
+        durations.append(get_event_duration(sched_event) if len(dtend) == 0 else SCHEDULES_DURATION_NONE)
+
+    if len(summaries) == 0:
+        return []
+
+    (startdts, start_valid) = parse_sched_datetimes(dtstarts)
+    (enddts, end_valid) = parse_sched_datetimes(dtends)
+
+    # events given a DURATION end that long after their start
+    durations = np.array(durations, dtype=np.int64)
+    by_duration = durations != SCHEDULES_DURATION_NONE
+    enddts = np.where(by_duration, startdts + durations.astype('timedelta64[s]'), enddts)
+    end_valid |= by_duration
+
+    valid = start_valid & end_valid
+    if not np.all(valid):
+        for idx in np.flatnonzero(~valid).tolist():
+            print("WARNING: skipping event with unsupported DTSTART/DTEND ({s!r}, {e!r}): {summary}".format(
+                    s=dtstarts[idx], e=dtends[idx], summary=summaries[idx]), file=sys.stderr)
+        summaries = [summary for (summary, ok) in zip(summaries, valid.tolist()) if ok]
+        startdts = startdts[valid]
+        enddts = enddts[valid]
+
+    start_secs = (startdts - startdts.astype('datetime64[D]')).astype(np.int64)
+    end_secs = (enddts - enddts.astype('datetime64[D]')).astype(np.int64)
+    start_dps = (start_secs // 3600) * 100 + (start_secs % 3600) // 60
+    end_dps = (end_secs // 3600) * 100 + (end_secs % 3600) // 60
+    dur_dps = np.trunc((enddts - startdts).astype(np.int64) / 60).astype(np.int64)
+    hour_ops_dps = get_hours_operational(startdts, enddts)
+
     sched_data = []
+    for (summary, start_dp, end_dp, dur_dp, hour_ops_dp) in zip(
+          summaries,
+          start_dps.tolist(),
+          end_dps.tolist(),
+          dur_dps.tolist(),
+          hour_ops_dps
+        ):
+        tokens = get_emtopic_tokens_from_event(summary)
+        tokens = [tok for tok in tokens if len(tok) > 0]
+
+        event_meta = {}
+        event_meta['request_id'] = get_request_id_from_event(summary)
+        event_meta['start_dp'] = start_dp
+        event_meta['end_dp'] = end_dp
+        event_meta['dur_dp'] = dur_dp
+        event_meta['tokens'] = tokens
+        event_meta['hour_ops'] = hour_ops_dp
+        sched_data.append(event_meta)
+
+    return sched_data
+
+def get_data_from_json(sched_file):
     sched_events = {}
 
     try:
@@ -268,24 +392,95 @@ def get_data_from_json(sched_file):
     dtstart_key = get_dtstart_key(example_record)
     dtend_key = get_dtend_key(example_record)
 
-    for sched_event in sched_events:
-        event_data = get_emtopic_metadata_from_event(
-                       sched_event,
-                       dtstart_key,
-                       dtend_key
-                     )
+    return get_emtopic_metadata_from_events(
+             sched_events,
+             dtstart_key,
+             dtend_key
+           )
+
+def get_ics_unfolded_lines(sched_file):
+    # yield logical content lines; a line starting with a space or tab
+    # continues the previous one (rfc5545 line folding)
+    content_line = None
+    with open(sched_file, encoding='utf-8') as scfh:
+        for line in scfh:
+            line = line.rstrip('\r\n')
+            if line.startswith(SCHEDULES_ICS_FOLD_CHARS):
+                if content_line is not None:
+                    content_line += line[1:]
+                continue
+            if content_line is not None:
+                yield content_line
+            content_line = line
+    if content_line is not None:
+        yield content_line
+
+def unescape_ics_text(value):
+    if SCHEDULES_ICS_ESCAPE_CHAR not in value:
+        return value
+
+    unescaped = []
+    chars = iter(value)
+    for char in chars:
+        if char == SCHEDULES_ICS_ESCAPE_CHAR:
+            char = next(chars, '')
+            if char in ('n', 'N'):
+                char = ' '
+        unescaped.append(char)
+    return ''.join(unescaped)
+
+def get_ics_events(sched_file):
+    # stream VEVENTs as dicts keyed the same way as the json converted
+    # payloads, e.g. 'DTSTART;TZID=US/Central'; properties of components
+    # nested in a VEVENT (e.g. VALARM) are skipped
+    sched_event = None
+    nested_depth = 0
+    for line in get_ics_unfolded_lines(sched_file):
+        if sched_event is None:
+            if line == 'BEGIN:VEVENT':
+                sched_event = {}
+                nested_depth = 0
+        elif line == 'END:VEVENT':
+            yield sched_event
+            sched_event = None
+        elif line.startswith(SCHEDULES_ICS_BEGIN):
+            nested_depth += 1
+        elif line.startswith(SCHEDULES_ICS_END):
+            nested_depth = max(nested_depth - 1, 0)
+        elif nested_depth == 0:
+            line_check = SCHEDULES_ICS_CONTENTLINE_REGEX.search(line)
+            if line_check:
+                sched_event[line_check.group(1)] = unescape_ics_text(line_check.group(2))
+
+def get_data_from_ics(sched_file):
+    try:
+        sched_events = get_ics_events(sched_file)
+        example_event = next(sched_events, None)
+        if example_event is None:
+            return []
 
-        if len(event_data) > 0:
-            sched_data.append(event_data)
+        example_record = example_event.keys()
 
-    return sched_data
+        dtstart_key = get_dtstart_key(example_record)
+        dtend_key = get_dtend_key(example_record)
+
+        return get_emtopic_metadata_from_events(
+                 chain([example_event], sched_events),
+                 dtstart_key,
+                 dtend_key
+               )
+    except (IOError, UnicodeDecodeError) as err:
+        raise EmException("BUG: {f} couldn't be processed for ics content".format(f=sched_file))
 
 def get_training_data():
     sched_files = get_sched_files()
     data_array = []
 
     for sched in sched_files:
-        data_array.append(get_data_from_json(sched))
+        if sched.lower().endswith(SCHEDULES_ICS_EXTENSION):
+            data_array.append(get_data_from_ics(sched))
+        else:
+            data_array.append(get_data_from_json(sched))
 
     return data_array
 
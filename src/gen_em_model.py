@@ -1,17 +1,34 @@
 #!/usr/bin/env python3
 """
 Usage:
-    gen_em_model.py [--help] [--debug] [--show-viz] [--save-model] [--viz-words=<word_count>] [--duration=<duration>] [--topics=<topic>] [--iterations=<num_iterations>] <training_metads_file> <new_topic_tokens> <method>
+    gen_em_model.py [--help] [--debug] [--duration=<duration>] [--min-fit=<ratio>] --load-model=<artifact_file> <new_topic_tokens>
+    gen_em_model.py [--help] [--debug] [--show-viz] [--save-model] [--viz-words=<word_count>] [--duration=<duration>] [--min-fit=<ratio>] [--topics=<topic>] [--iterations=<num_iterations>] [--ensemble-methods=<methods>] [--ensemble-weights=<weights>] [--voting=<voting>] [--cache=<cache_file>] [--cache-size=<bytes>] [--no-tfidf] [--min-df=<count>] [--max-df=<fraction>] [--hash-buckets=<buckets>] [--export-model=<artifact_file>] [--quantize=<precision>] [--checkpoint=<checkpoint_file>] [--checkpoint-every=<iterations>] [--resume] <training_metads_file> <new_topic_tokens> <method>
 
 Options:
   --topics=<topics>       number of topic clusters to generate
   --viz-words=<word_count>    number of top words to show around each topic
   --duration=<duration>   duration (in minutes) of new topic tokens event
+  --min-fit=<ratio>       fit (share of events lasting the duration) an hour needs to be preferred (default: 0.5)
+  --ensemble-methods=<methods>    comma separated methods trained by the ensemble method (default: em,lda,lsa)
+  --ensemble-weights=<weights>    comma separated vote weights of the ensemble methods (default: 1.0 each)
+  --voting=<voting>       how ensemble hour suggestions are combined: majority|weighted (default: weighted)
+  --cache=<cache_file>    on-disk query cache of suggestions (reused while the datasource and model are unchanged)
+  --cache-size=<bytes>    maximum size of the query cache before least recently used entries are evicted
+  --no-tfidf              do not weight counts by inverse document frequency (lsa_rsvd method)
+  --min-df=<count>        prune tokens appearing in fewer events (default: 1)
+  --max-df=<fraction>     prune tokens appearing in a larger fraction of events (default: 1.0)
+  --hash-buckets=<buckets>    hash tokens into a fixed number of buckets (default: 0, no hashing)
+  --export-model=<artifact_file>    export a compact serving artifact of the trained EM model
+  --quantize=<precision>  lowest precision of the exported log_P: int8|float16|float32|float64 (default: int8)
+  --load-model=<artifact_file>      answer the query from a serving artifact without training
+  --checkpoint=<checkpoint_file>    checkpoint EM training state to this file (written atomically)
+  --checkpoint-every=<iterations>   EM iterations between checkpoints (default: 0, only once finished)
+  --resume                resume EM training from the checkpoint file if it exists
 
 Arguments:
   <training_metads_file>  filename with emtopic training metadata (in JSON)
   <new_topic_tokens>      string of topic tokens to suggest on
-  <method>                string of topic modeling algorithm
+  <method>                string of topic modeling algorithm (em|lda|lsa|lsa_rsvd|ensemble)
 
 Options:
   -h, --help    Show this screen and exit.
@@ -24,6 +41,7 @@ import math
 import re
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor
 from docopt import docopt
 from operator import itemgetter
 from typing import Dict, List, Tuple, Any
@@ -32,10 +50,22 @@ sys.path.insert(1, './lib')
 import EMTopicModel as emtm
 import VisualizeEMTopicModel as vemtm
 import LdaLsaTopicModel as ldalsatm
+import EventIntervalIndex as evii
+import QueryCache as qcache
+import Vocabulary as vocabm
+import ModelArtifact as martifact
 
 DEFAULT_VIZ_WORD_COUNT = 5
 DEFAULT_DURATION = 60
+# minimum share of the events started at an hour that lasted the requested duration
+DEFAULT_MIN_FIT = 0.5
+# how much of a fitting hour's score its share of the busiest hour's overlap takes away
+LOAD_WEIGHT = 0.5
 DEFAULT_NUM_ITERATIONS = 250
+DEFAULT_ENSEMBLE_METHODS = ['em', 'lda', 'lsa']
+DEFAULT_VOTING = 'weighted'
+VOTING_METHODS = ['majority', 'weighted']
+DEFAULT_REGRESSION_QUERIES = 1000
 
 # https://scikit-learn.org/stable/modules/generated/sklearn.mixture.GaussianMixture.html#sklearn.mixture.GaussianMixture
 
@@ -153,7 +183,6 @@ def emtopic_tokens_from_event(event_summary: str, min_len: int = 2) -> List[str]
     event_summary = event_summary.lower()
 
     # finally, return the list of tokens from the summary
-    print("Query Tokens Processed: {}".format(event_summary.split(' ')))
     return event_summary.split(' ')
 
 
@@ -197,37 +226,69 @@ def calc_max_logP_token(new_tokens: List[str], ordered_tokens: List[str], log_P_
     return max_log_P_W_token
 
 
-def calc_max_token_hour_ops(token: str, dt_token_group_counts: Dict[str, Dict[str, int]]) -> \
-        Tuple[int, int]:
+def calc_max_token_hour_ops(token: str, dt_token_group_counts: Dict[str, Dict[str, int]],
+                            interval_index: Dict[str, np.ndarray] = None, duration: int = None,
+                            min_fit: float = DEFAULT_MIN_FIT) -> Tuple[int, int]:
     """
     Calculate the hour with the maximum frequency of a specific token.
 
+    When an interval index and duration are given, hours whose fit (the share of events started
+    there that lasted the requested duration) reaches min_fit are preferred. Hours are scored by
+    frequency times fit, less LOAD_WEIGHT times their overlap relative to the busiest candidate
+    hour; frequency breaks ties.
+
     Parameters:
     - token (str): The token for which to calculate the maximum frequency hour.
     - dt_token_group_counts (Dict[str, Dict[str, int]]): Dictionary containing token counts grouped by hours.
+    - interval_index (Dict[str, np.ndarray]): Interval index over historical events. Defaults to None.
+    - duration (int): Requested duration (in minutes) of the event. Defaults to None.
+    - min_fit (float): Fit an hour needs to be preferred. Defaults to DEFAULT_MIN_FIT.
 
     Returns:
     - Tuple[int, int]: A tuple containing the hour with the maximum frequency of
     the specified token and the frequency value.
     """
     max_hour_ops_freq = (np.inf, -np.inf)
+    candidates = []
 
     for dt_key, dt_val in dt_token_group_counts.items():
         if token not in dt_val.keys():
             continue
 
         tok_count = dt_token_group_counts[dt_key][token]
-        max_hour_ops_freq = max(
-            [max_hour_ops_freq, (dt_key, tok_count)],
-            key=itemgetter(1)
-        )
+
+        if interval_index is None or duration is None:
+            max_hour_ops_freq = max(
+                [max_hour_ops_freq, (dt_key, tok_count)],
+                key=itemgetter(1)
+            )
+            continue
+
+        fit, overlap = evii.score_window(interval_index, dt_key, duration)
+        candidates.append((dt_key, tok_count, fit, overlap))
+
+    if len(candidates) == 0:
+        return max_hour_ops_freq
+
+    max_overlap = max(max(candidate[3] for candidate in candidates), 1)
+    max_rank = None
+
+    for dt_key, tok_count, fit, overlap in candidates:
+        score = tok_count * fit * (1.0 - LOAD_WEIGHT * overlap / max_overlap)
+        rank = (fit >= min_fit, score, tok_count)
+
+        if max_rank is None or rank > max_rank:
+            max_rank = rank
+            max_hour_ops_freq = (dt_key, tok_count)
 
     return max_hour_ops_freq
 
 
 def suggest_hour_ops_by_tokens(new_tokens: List[str], ordered_tokens: List[str],
                                dt_token_group_counts: Dict[str, Dict[str, int]], log_P_at_idx: np.ndarray,
-                               debug: bool = False) -> List[Tuple[Tuple[str, float], Tuple[int, int]]]:
+                               interval_index: Dict[str, np.ndarray] = None, duration: int = None,
+                               min_fit: float = DEFAULT_MIN_FIT, debug: bool = False) -> \
+        List[Tuple[Tuple[str, float], Tuple[int, int]]]:
     """
     Suggest hour operations based on token probabilities.
 
@@ -236,6 +297,9 @@ def suggest_hour_ops_by_tokens(new_tokens: List[str], ordered_tokens: List[str],
     - ordered_tokens (List[str]): List of ordered tokens.
     - dt_token_group_counts (Dict[str, Dict[str, int]]): Dictionary containing token counts grouped by hours.
     - log_P_at_idx (np.ndarray): Array of log probabilities at the corresponding indices.
+    - interval_index (Dict[str, np.ndarray]): Interval index over historical events. Defaults to None.
+    - duration (int): Requested duration (in minutes) of the event. Defaults to None.
+    - min_fit (float): Fit an hour needs to be preferred (see calc_max_token_hour_ops). Defaults to DEFAULT_MIN_FIT.
     - debug (bool): Flag to print debug information. Defaults to False.
 
     Returns:
@@ -253,13 +317,15 @@ def suggest_hour_ops_by_tokens(new_tokens: List[str], ordered_tokens: List[str],
 
     max_token = max_log_P_EvenW_token[0]
 
-    evenW_token_hour_ops = calc_max_token_hour_ops(max_token, dt_token_group_counts)
+    evenW_token_hour_ops = calc_max_token_hour_ops(max_token, dt_token_group_counts, interval_index, duration,
+                                                   min_fit=min_fit)
 
     max_log_P_OrderW_token = calc_max_logP_token(new_tokens, ordered_tokens, log_P_at_idx, tok_OrderW, debug=debug)
 
     max_token = max_log_P_OrderW_token[0]
 
-    orderW_token_hour_ops = calc_max_token_hour_ops(max_token, dt_token_group_counts)
+    orderW_token_hour_ops = calc_max_token_hour_ops(max_token, dt_token_group_counts, interval_index, duration,
+                                                   min_fit=min_fit)
 
     return [(max_log_P_EvenW_token, evenW_token_hour_ops),
             (max_log_P_OrderW_token, orderW_token_hour_ops)
@@ -391,6 +457,304 @@ def transform_metadata_uci(metadata: List[List[Dict[str, Any]]]) -> \
     return ordered_tokens, dt_token_group_counts, X
 
 
+def query_token_counts(ordered_tokens: List[str], new_tokens: List[str]) -> np.ndarray:
+    """
+    Count the new tokens over the word columns of the count matrix.
+
+    Parameters:
+    - ordered_tokens (List[str]): List of ordered tokens.
+    - new_tokens (List[str]): List of new tokens.
+
+    Returns:
+    - np.ndarray: Counts of the new tokens of the shape (d,) (unknown tokens are dropped).
+    """
+    tokmap = {tok: idx for idx, tok in enumerate(ordered_tokens)}
+    counts = np.zeros(len(ordered_tokens))
+    for token in new_tokens:
+        if token in tokmap:
+            counts[tokmap[token]] += 1
+
+    return counts
+
+
+def fit_topic_model(model_type: str, metadata: List[List[Dict[str, Any]]], X: np.ndarray, topics: int,
+                    iterations: int = DEFAULT_NUM_ITERATIONS, lsa_tfidf: bool = True,
+                    debug: bool = False) -> Dict[str, Any]:
+    """
+    Train a topic model without querying it.
+
+    Parameters:
+    - model_type (str): Topic modeling algorithm (em|lda|lsa|lsa_rsvd).
+    - metadata (List[List[Dict[str, Any]]]): Metadata the LDA/LSA corpus is built from.
+    - X (np.ndarray): Token count matrix the EM and randomized SVD LSA models are trained on.
+    - topics (int): The number of topic clusters.
+    - iterations (int): The number of EM iterations. Defaults to DEFAULT_NUM_ITERATIONS.
+    - lsa_tfidf (bool): Whether randomized SVD LSA weights counts by idf. Defaults to True.
+    - debug (bool): Flag to print debug information. Defaults to False.
+
+    Returns:
+    - Dict[str, Any]: The trained model state passed to query_topic_model.
+    """
+    if model_type == "lsa_rsvd":
+        return ldalsatm.lsa_rsvd_fit(X, topics, tfidf=lsa_tfidf)
+
+    if model_type == "lsa":
+        lsa_model, dictionary, _ = ldalsatm.lsa_fit(metadata, topics)
+        return {'model': lsa_model, 'dictionary': dictionary}
+
+    if model_type == "lda":
+        lda_model, dictionary, _ = ldalsatm.lda_fit(metadata, topics)
+        return {'model': lda_model, 'dictionary': dictionary}
+
+    log_pi, log_P, _ = emtm.run(X, topics, iterations=iterations, debug=debug)
+    return {'log_pi': log_pi, 'log_P': log_P}
+
+
+def query_topic_model(model_type: str, model: Dict[str, Any], ordered_tokens: List[str],
+                      new_tokens: List[str]) -> np.ndarray:
+    """
+    Get the per-token weights (aligned to ordered_tokens) a trained topic model gives a new request.
+
+    Parameters:
+    - model_type (str): Topic modeling algorithm (em|lda|lsa|lsa_rsvd).
+    - model (Dict[str, Any]): Trained model state from fit_topic_model.
+    - ordered_tokens (List[str]): List of ordered tokens.
+    - new_tokens (List[str]): List of new tokens.
+
+    Returns:
+    - np.ndarray: Weights of the chosen topic, as passed to suggest_hour_ops_by_tokens.
+    """
+    if model_type == "lsa_rsvd":
+        return ldalsatm.lsa_rsvd_query(model, query_token_counts(ordered_tokens, new_tokens))
+
+    if model_type == "lsa":
+        return ldalsatm.lsa_query(model['model'], model['dictionary'], new_tokens, ordered_tokens)
+
+    if model_type == "lda":
+        pi, log_P = ldalsatm.lda_query(model['model'], model['dictionary'], new_tokens, ordered_tokens)
+        topic_idx, _ = vemtm.get_top_topic_probability(np.log(pi))
+        return log_P[topic_idx]
+
+    topic_idx, _ = vemtm.get_top_topic_probability(model['log_pi'])
+    return model['log_P'][topic_idx]
+
+
+# training inputs shared with every ensemble worker process
+_ensemble_inputs = {}
+
+
+def init_ensemble_worker(inputs: Dict[str, Any]):
+    """
+    Share the once-loaded corpus, count matrix and query with an ensemble worker process.
+
+    Parameters:
+    - inputs (Dict[str, Any]): metadata, X, ordered_tokens, dt_token_group_counts, interval_index,
+    new_tokens, topics, iterations, lsa_tfidf, duration and min_fit.
+    """
+    global _ensemble_inputs
+    _ensemble_inputs = inputs
+
+
+def run_ensemble_member(model_type: str) -> List[Tuple[Tuple[str, float], Tuple[int, int]]]:
+    """
+    Train one ensemble member on the shared inputs and suggest hours for the shared query.
+
+    Parameters:
+    - model_type (str): Topic modeling algorithm (em|lda|lsa|lsa_rsvd).
+
+    Returns:
+    - List[Tuple[Tuple[str, float], Tuple[int, int]]]: The member's suggestions.
+    """
+    inputs = _ensemble_inputs
+    model = fit_topic_model(model_type, inputs['metadata'], inputs['X'], inputs['topics'],
+                            iterations=inputs['iterations'], lsa_tfidf=inputs['lsa_tfidf'])
+    weights = query_topic_model(model_type, model, inputs['ordered_tokens'], inputs['new_tokens'])
+
+    return suggest_hour_ops_by_tokens(inputs['new_tokens'], inputs['ordered_tokens'],
+                                      inputs['dt_token_group_counts'], weights,
+                                      interval_index=inputs['interval_index'], duration=inputs['duration'],
+                                      min_fit=inputs['min_fit'])
+
+
+def vote_suggestions(member_suggestions: List[List[Tuple[Tuple[str, float], Tuple[int, int]]]],
+                     weights: List[float], voting: str = DEFAULT_VOTING) -> \
+        List[Tuple[Tuple[str, float], Tuple[int, int]]]:
+    """
+    Combine the suggestions of the ensemble members, decision by decision.
+
+    Every member votes for the hour of its decision; with 'majority' voting each member counts once,
+    with 'weighted' voting each member counts its weight. Ties go to the earliest member. The winning
+    hour is reported with the term and frequency of the first member that voted for it.
+
+    Parameters:
+    - member_suggestions (List[List[Tuple[Tuple[str, float], Tuple[int, int]]]]): Suggestions of each member.
+    - weights (List[float]): Vote weight of each member.
+    - voting (str): How votes are counted (majority|weighted). Defaults to DEFAULT_VOTING.
+
+    Returns:
+    - List[Tuple[Tuple[str, float], Tuple[int, int]]]: The combined suggestions.
+    """
+    num_decisions = min(len(suggestions) for suggestions in member_suggestions)
+    combined = []
+
+    for decision in range(num_decisions):
+        votes = {}
+        representative = {}
+
+        for member, suggestions in enumerate(member_suggestions):
+            suggestion = suggestions[decision]
+            hour = suggestion[1][0]
+            if suggestion[0][0] is None:
+                continue
+
+            votes[hour] = votes.get(hour, 0.0) + (1.0 if voting == 'majority' else weights[member])
+            representative.setdefault(hour, suggestion)
+
+        if len(votes) == 0:
+            combined.append(member_suggestions[0][decision])
+            continue
+
+        max_hour = max(votes.keys(), key=lambda hour: votes[hour])
+        combined.append(representative[max_hour])
+
+    return combined
+
+
+def suggest_from_artifact(artifact: Dict[str, Any], new_tokens: List[str], duration: int = None,
+                          min_fit: float = DEFAULT_MIN_FIT, debug: bool = False) -> \
+        List[Tuple[Tuple[str, float], Tuple[int, int]]]:
+    """
+    Suggest hour operations from a serving artifact (see export_model_artifact).
+
+    Parameters:
+    - artifact (Dict[str, Any]): Artifact from ModelArtifact.load_artifact.
+    - new_tokens (List[str]): List of new tokens, already mapped onto the artifact's vocabulary.
+    - duration (int): Requested duration (in minutes) of the event. Defaults to None.
+    - min_fit (float): Fit an hour needs to be preferred. Defaults to DEFAULT_MIN_FIT.
+    - debug (bool): Flag to print debug information. Defaults to False.
+
+    Returns:
+    - List[Tuple[Tuple[str, float], Tuple[int, int]]]: Suggestions as from suggest_hour_ops_by_tokens.
+    """
+    log_P_at_idx = martifact.dequantize_log_P_row(artifact)
+    dt_token_group_counts = martifact.token_group_counts(artifact, new_tokens)
+    interval_index = artifact_interval_index(artifact)
+
+    return suggest_hour_ops_by_tokens(new_tokens, artifact['header']['tokens'], dt_token_group_counts, log_P_at_idx,
+                                      interval_index=interval_index, duration=duration, min_fit=min_fit,
+                                      debug=debug)
+
+
+def artifact_interval_index(artifact: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Get the interval index over historical events stored in a serving artifact.
+
+    Parameters:
+    - artifact (Dict[str, Any]): Artifact from ModelArtifact.load_artifact.
+
+    Returns:
+    - Dict[str, np.ndarray]: Index as from EventIntervalIndex.build_interval_index.
+    """
+    return {name[len('interval_'):]: array for name, array in artifact['arrays'].items()
+            if name.startswith('interval_')}
+
+
+def export_model_artifact(fname: str, ordered_tokens: List[str], dt_token_group_counts: Dict[int, Dict[str, int]],
+                          log_pi: np.ndarray, log_P: np.ndarray, interval_index: Dict[str, np.ndarray],
+                          vocab: Dict[str, Any], metadata: List[List[Dict[str, Any]]],
+                          precision: str = martifact.DEFAULT_QUANTIZE, debug: bool = False) -> str:
+    """
+    Export a compact serving artifact of a trained EM model.
+
+    Only what queries need is kept: log_pi, the chosen topic's row of log_P (quantized), the
+    vocabulary, the (sparse) token to hour table and the interval index. Starting at the given
+    precision, the artifact is checked against the full precision model on a regression set of
+    historical events, and written again at the next precision until every suggestion is
+    identical (float64 always is).
+
+    Parameters:
+    - fname (str): The name of the artifact file.
+    - ordered_tokens (List[str]): List of ordered tokens.
+    - dt_token_group_counts (Dict[int, Dict[str, int]]): Dictionary containing token counts grouped by hours.
+    - log_pi (np.ndarray): A numpy array of shape (t,1) where t is the number of topics for clustering.
+    - log_P (np.ndarray): A numpy array of shape (t,d) where d is the number of words.
+    - interval_index (Dict[str, np.ndarray]): Interval index over historical events.
+    - vocab (Dict[str, Any]): Vocabulary from Vocabulary.build_vocabulary.
+    - metadata (List[List[Dict[str, Any]]]): Metadata (with mapped tokens) the regression set is drawn from.
+    - precision (str): Lowest precision to try (int8|float16|float32|float64). Defaults to int8.
+    - debug (bool): Flag to print debug information. Defaults to False.
+
+    Returns:
+    - str: The precision the artifact was written with.
+    """
+    records = [record for grouping in metadata for record in grouping]
+    step = max(1, len(records) // DEFAULT_REGRESSION_QUERIES)
+    regression_set = [(record['tokens'], record['dur_dp']) for record in records[::step]]
+
+    topic_idx, _ = vemtm.get_top_topic_probability(log_pi)
+    expected = [
+        [(suggestion[0][0], suggestion[1]) for suggestion in
+         suggest_hour_ops_by_tokens(tokens, ordered_tokens, dt_token_group_counts, log_P[topic_idx],
+                                    interval_index=interval_index, duration=duration)]
+        for tokens, duration in regression_set
+    ]
+
+    header = {
+        'topic_idx': int(topic_idx),
+        'tokens': ordered_tokens,
+        'hours': list(dt_token_group_counts.keys()),
+        'vocab': {
+            'keep': sorted(vocab['keep']) if vocab['keep'] is not None else None,
+            'hash_buckets': vocab['hash_buckets'],
+        },
+    }
+    arrays = {
+        'log_pi': log_pi,
+        **martifact.hour_token_table(ordered_tokens, dt_token_group_counts),
+        **{f'interval_{name}': martifact.narrow_ints(array) for name, array in interval_index.items()},
+    }
+
+    precisions = martifact.QUANTIZE_PRECISIONS
+    for precision in precisions[precisions.index(precision):]:
+        martifact.write_artifact(fname, {**header, 'quantize': precision},
+                                 {**arrays, **martifact.quantize_log_P_row(log_P[topic_idx], precision)})
+
+        artifact = martifact.load_artifact(fname)
+        mismatches = sum(
+            1 for (tokens, duration), suggestions in zip(regression_set, expected)
+            if [(suggestion[0][0], suggestion[1]) for suggestion in
+                suggest_from_artifact(artifact, tokens, duration)] != suggestions
+        )
+
+        if debug is True:
+            print(f"Artifact precision {precision}: {mismatches} of {len(regression_set)} regression queries differ")
+
+        if mismatches == 0:
+            break
+
+    return precision
+
+
+def print_suggestions(suggestions: List[Tuple[Tuple[str, float], Tuple[int, int]]],
+                      interval_index: Dict[str, np.ndarray] = None, duration: int = None, debug: bool = False):
+    """
+    Print the suggestions as numbered Decisions.
+
+    Parameters:
+    - suggestions (List[Tuple[Tuple[str, float], Tuple[int, int]]]): Suggestions from suggest_hour_ops_by_tokens.
+    - interval_index (Dict[str, np.ndarray]): Interval index over historical events. Defaults to None.
+    - duration (int): Requested duration (in minutes) of the event. Defaults to None.
+    - debug (bool): Flag to print the window fit and overlap of each suggestion. Defaults to False.
+    """
+    print(f"Suggestions:")
+    for i, suggestion in enumerate(suggestions):
+        print(f"Decision {i + 1}. Term: '{suggestion[0][0]}'. Hour: {suggestion[1][0]}. Frequency: {suggestion[1][1]} ")
+
+        if debug is True and interval_index is not None and suggestion[0][0] is not None:
+            fit, overlap = evii.score_window(interval_index, suggestion[1][0], duration)
+            print(f"  Window Fit: {fit:.2f}  Historical Overlap: {overlap}")
+
+
 if __name__ == '__main__':
     args = docopt(__doc__)
     tsdata = args['<training_metads_file>']
@@ -400,6 +764,7 @@ if __name__ == '__main__':
 
     showviz = args['--show-viz'] or False
     savemodel = args['--save-model'] or False
+    lsa_tfidf = not args['--no-tfidf']
 
     try:
         N = int(args['--viz-words'])
@@ -411,14 +776,129 @@ if __name__ == '__main__':
     except Exception:
         duration = DEFAULT_DURATION
 
+    try:
+        min_fit = float(args['--min-fit'])
+    except Exception:
+        min_fit = DEFAULT_MIN_FIT
+
     try:
         iterations = int(args['--iterations'])
     except Exception:
         iterations = DEFAULT_NUM_ITERATIONS
 
+    ensemble_methods = DEFAULT_ENSEMBLE_METHODS
+    if args['--ensemble-methods'] is not None:
+        ensemble_methods = [method.strip() for method in args['--ensemble-methods'].split(',') if method.strip()]
+
+    try:
+        ensemble_weights = [float(weight) for weight in args['--ensemble-weights'].split(',')]
+    except Exception:
+        ensemble_weights = [1.0] * len(ensemble_methods)
+
+    voting = args['--voting'] or DEFAULT_VOTING
+
+    if model_type == "ensemble":
+        if voting not in VOTING_METHODS:
+            sys.stderr.write(f"Error: '--voting' needs to be one of {VOTING_METHODS}\n")
+            sys.exit(1)
+        if len(ensemble_weights) != len(ensemble_methods):
+            sys.stderr.write("Error: '--ensemble-weights' needs one weight per ensemble method\n")
+            sys.exit(1)
+
+    if args['--export-model'] is not None and model_type != "em":
+        sys.stderr.write("Error: '--export-model' needs the em method\n")
+        sys.exit(1)
+
+    try:
+        min_df = int(args['--min-df'])
+    except Exception:
+        min_df = vocabm.DEFAULT_MIN_DF
+
+    try:
+        max_df = float(args['--max-df'])
+    except Exception:
+        max_df = vocabm.DEFAULT_MAX_DF
+
+    try:
+        hash_buckets = int(args['--hash-buckets'])
+    except Exception:
+        hash_buckets = vocabm.DEFAULT_HASH_BUCKETS
+
+    try:
+        cache_size = int(args['--cache-size'])
+    except Exception:
+        cache_size = qcache.DEFAULT_CACHE_MAX_SIZE
+
+    try:
+        checkpoint_interval = int(args['--checkpoint-every'])
+    except Exception:
+        checkpoint_interval = 0
+
     new_tokens = emtopic_tokens_from_event(cli_tokens)
+    print("Query Tokens Processed: {}".format(new_tokens))
+
+    if args['--load-model'] is not None:
+        try:
+            artifact = martifact.load_artifact(args['--load-model'])
+        except (IOError, ValueError) as err:
+            sys.stderr.write(f"Error loading {args['--load-model']}: {err}\n")
+            sys.exit(1)
+
+        vocab = artifact['header']['vocab']
+        vocab = {**vocab, 'keep': set(vocab['keep']) if vocab['keep'] is not None else None}
+        query_terms = vocabm.token_names(vocab, new_tokens)
+        new_tokens = vocabm.map_tokens(vocab, new_tokens)
+
+        print(f"Topic Model Method: EM (artifact, {artifact['header']['quantize']})")
+        suggestions = suggest_from_artifact(artifact, new_tokens, duration, min_fit=min_fit, debug=debug)
+        suggestions = [((query_terms.get(suggestion[0][0], suggestion[0][0]), suggestion[0][1]), suggestion[1])
+                       for suggestion in suggestions]
+        print_suggestions(suggestions, artifact_interval_index(artifact), duration, debug=debug)
+        sys.exit(0)
+
+    query_cache = None
+    if args['--cache'] is not None:
+        source_fp = qcache.source_fingerprint(tsdata)
+        model_fp = qcache.model_fingerprint(source_fp, {
+            'topics': args['--topics'],
+            'iterations': iterations,
+            'lsa_tfidf': lsa_tfidf,
+            'duration': duration,
+            'min_fit': min_fit,
+            'ensemble_methods': ensemble_methods,
+            'ensemble_weights': ensemble_weights,
+            'voting': voting,
+            'min_df': min_df,
+            'max_df': max_df,
+            'hash_buckets': hash_buckets,
+        })
+        cache_key = qcache.cache_key(model_fp, new_tokens, model_type)
+        query_cache = qcache.open_cache(args['--cache'], source_fp)
+
+        # the visualization, saved/exported model and checkpoints all need a training run,
+        # so only skip training without them
+        needs_training = showviz or savemodel or args['--export-model'] is not None or \
+            args['--checkpoint'] is not None
+        suggestions = None if needs_training else qcache.get_cached(query_cache, cache_key)
+        if suggestions is not None:
+            print(f"Topic Model Method: {model_type.upper()} (cached)")
+            print_suggestions(suggestions)
+            sys.exit(0)
 
     metadata = get_metadata(tsdata)
+    interval_index = evii.build_interval_index(metadata)
+
+    # bound the vocabulary the same way for the count matrix, the LDA/LSA corpus and the query
+    vocab = vocabm.build_vocabulary(metadata, min_df=min_df, max_df=max_df, hash_buckets=hash_buckets)
+    if vocab['keep'] is not None and len(vocab['keep']) == 0:
+        sys.stderr.write(f"Error: '--min-df={min_df}' and '--max-df={max_df}' prune every token\n")
+        sys.exit(1)
+    metadata = vocabm.apply_vocabulary(vocab, metadata)
+    query_terms = vocabm.token_names(vocab, new_tokens)
+    new_tokens = vocabm.map_tokens(vocab, new_tokens)
+
+    if debug is True:
+        print(f"Query Tokens Mapped: {new_tokens}")
 
     ordered_tokens, dt_token_group_counts, X = transform_metadata_uci(metadata)
     num_docs = X.shape[0]
@@ -430,26 +910,40 @@ if __name__ == '__main__':
 
     if model_type == "lsa":
         print("Topic Model Method: LSA")
-        term_contributions, coherence_scores = ldalsatm.lsa(metadata, topics, new_tokens)
+        term_contributions, coherence_scores = ldalsatm.lsa(metadata, topics, new_tokens, ordered_tokens)
         for measure in coherence_scores:
             print(f"Coherence score ('{measure}' measure) for the LSA model with {topics} topics: "
                   f"{coherence_scores[measure]}")
         suggestions = suggest_hour_ops_by_tokens(new_tokens, ordered_tokens, dt_token_group_counts, term_contributions,
-                                                 debug=debug)
+                                                 interval_index=interval_index, duration=duration,
+                                                 min_fit=min_fit, debug=debug)
 
         if debug is True:
             print(f"Documents: {num_docs}  Topic Clusters: {topics}")
             score_str = ", ".join([f"{coherence_scores[measure]} ({measure})" for measure in coherence_scores])
             print(f"Coherence scores for the LDA model with {topics} topics: {score_str}")
 
+    elif model_type == "lsa_rsvd":
+        print("Topic Model Method: LSA (randomized SVD)")
+        lsa_model = fit_topic_model(model_type, metadata, X, topics, lsa_tfidf=lsa_tfidf)
+        term_contributions = query_topic_model(model_type, lsa_model, ordered_tokens, new_tokens)
+        suggestions = suggest_hour_ops_by_tokens(new_tokens, ordered_tokens, dt_token_group_counts, term_contributions,
+                                                 interval_index=interval_index, duration=duration,
+                                                 min_fit=min_fit, debug=debug)
+
+        if debug is True:
+            print(f"Documents: {num_docs}  Topic Clusters: {len(lsa_model['s'])}  TF-IDF: {lsa_tfidf}")
+            print(f"Singular Values:\n{lsa_model['s']}")
+
     elif model_type == "lda":
         print("Topic Model Method: LDA")
-        pi, log_P, coherence_scores = ldalsatm.lda(metadata, topics, new_tokens)
+        pi, log_P, coherence_scores = ldalsatm.lda(metadata, topics, new_tokens, ordered_tokens)
 
         log_pi = np.log(pi)
         topic_idx, topic_prob = vemtm.get_top_topic_probability(log_pi)
         suggestions = suggest_hour_ops_by_tokens(new_tokens, ordered_tokens, dt_token_group_counts, log_P[topic_idx],
-                                                 debug=debug)
+                                                 interval_index=interval_index, duration=duration,
+                                                 min_fit=min_fit, debug=debug)
 
         if debug is True:
             print(f"Documents: {num_docs}  Topic Clusters: {topics}")
@@ -459,12 +953,48 @@ if __name__ == '__main__':
             score_str = ", ".join([f"{coherence_scores[measure]} ({measure})" for measure in coherence_scores])
             print(f"Coherence scores for the LDA model with {topics} topics: {score_str}")
 
+    elif model_type == "ensemble":
+        print(f"Topic Model Method: ENSEMBLE ({', '.join(method.upper() for method in ensemble_methods)})")
+        ensemble_inputs = {
+            'metadata': metadata,
+            'X': X,
+            'ordered_tokens': ordered_tokens,
+            'dt_token_group_counts': dt_token_group_counts,
+            'interval_index': interval_index,
+            'new_tokens': new_tokens,
+            'topics': topics,
+            'iterations': iterations,
+            'lsa_tfidf': lsa_tfidf,
+            'duration': duration,
+            'min_fit': min_fit,
+        }
+
+        with ProcessPoolExecutor(max_workers=len(ensemble_methods), initializer=init_ensemble_worker,
+                                 initargs=(ensemble_inputs,)) as executor:
+            member_suggestions = list(executor.map(run_ensemble_member, ensemble_methods))
+
+        suggestions = vote_suggestions(member_suggestions, ensemble_weights, voting)
+
+        if debug is True:
+            print(f"Documents: {num_docs}  Topic Clusters: {topics}  Voting: {voting}")
+            for method, weight, member in zip(ensemble_methods, ensemble_weights, member_suggestions):
+                decisions = ", ".join([f"'{suggestion[0][0]}' @ {suggestion[1][0]}" for suggestion in member])
+                print(f"{method.upper()} (weight {weight}): {decisions}")
+
     else:
         print("Topic Model Method: EM")
-        log_pi, log_P, log_W = emtm.run(X, topics, iterations=iterations, debug=debug)
+        try:
+            log_pi, log_P, log_W = emtm.run(X, topics, iterations=iterations, debug=debug,
+                                            checkpoint_path=args['--checkpoint'],
+                                            checkpoint_interval=checkpoint_interval,
+                                            resume=args['--resume'] or False)
+        except ValueError as err:
+            sys.stderr.write(f"Error resuming {args['--checkpoint']}: {err}\n")
+            sys.exit(1)
         topic_idx, topic_prob = vemtm.get_top_topic_probability(log_pi)
         suggestions = suggest_hour_ops_by_tokens(new_tokens, ordered_tokens, dt_token_group_counts, log_P[topic_idx],
-                                                 debug=debug)
+                                                 interval_index=interval_index, duration=duration,
+                                                 min_fit=min_fit, debug=debug)
 
 
         if debug is True:
@@ -477,11 +1007,23 @@ if __name__ == '__main__':
         if savemodel is not False:
             np.savez_compressed("em_topicmodel", X, log_pi, log_P, log_W)
 
-    print(f"Suggestions:")
-    for i, suggestion in enumerate(suggestions):
-        print(f"Decision {i + 1}. Term: '{suggestion[0][0]}'. Hour: {suggestion[1][0]}. Frequency: {suggestion[1][1]} ")
+        if args['--export-model'] is not None:
+            precision = export_model_artifact(args['--export-model'], ordered_tokens, dt_token_group_counts,
+                                              log_pi, log_P, interval_index, vocab, metadata,
+                                              precision=args['--quantize'] or martifact.DEFAULT_QUANTIZE,
+                                              debug=debug)
+            print(f"Exported Model: {args['--export-model']} (log_P {precision})")
+
+    # report the query's own terms rather than hash buckets
+    suggestions = [((query_terms.get(suggestion[0][0], suggestion[0][0]), suggestion[0][1]), suggestion[1])
+                   for suggestion in suggestions]
+
+    if query_cache is not None:
+        qcache.put_cached(query_cache, cache_key, source_fp, suggestions, cache_size)
+
+    print_suggestions(suggestions, interval_index, duration, debug=debug)
 
     # LSA is based in reduction of dimensionality using SVD, it is not a probabilistic method, so
-    # we can't visualize topic models with log probabilities
-    if showviz is not False and model_type != "lsa":
+    # we can't visualize topic models with log probabilities (nor a single one for an ensemble)
+    if showviz is not False and model_type not in ("lsa", "lsa_rsvd", "ensemble"):
         vemtm.viz_topic_freqs(ordered_tokens, log_pi, log_P, topics, topic_idx, N)
@@ -1,4 +1,6 @@
+import os
 import sys
+import zlib
 import numpy as np
 from scipy.special import logsumexp
 
@@ -98,17 +100,100 @@ def update_log_pi(log_W):
     return log_pi
 
 
-def run(X: np.ndarray, topics: int, iterations: int = 100, seed: int = 12345, debug: bool = False) -> \
+def data_checksum(X: np.ndarray) -> int:
+    """
+    Checksum the document/word matrix, so a checkpoint is only resumed against the same data.
+
+    Parameters:
+    - X (np.ndarray): A numpy array of shape (N,d) where N is the number of documents and d is the number of words.
+
+    Returns:
+    - int: The crc32 of the matrix bytes.
+    """
+    return zlib.crc32(np.ascontiguousarray(X).tobytes())
+
+
+def save_checkpoint(fname: str, X: np.ndarray, seed: int, iteration: int, log_pi: np.ndarray, log_P: np.ndarray,
+                    log_W: np.ndarray, np_rand: np.random.RandomState):
+    """
+    Save the state of an EM run atomically (to a temporary file renamed into place).
+
+    Parameters:
+    - fname (str): The name of the checkpoint file.
+    - X (np.ndarray): A numpy array of shape (N,d) where N is the number of documents and d is the number of words.
+    - seed (int): Seed for random generation.
+    - iteration (int): The number of completed iterations.
+    - log_pi (np.ndarray): A numpy array of shape (t,1) where t is the number of topics for clustering.
+    - log_P (np.ndarray): A numpy array of shape (t,d) where t is the number of topics for clustering.
+    - log_W (np.ndarray): A numpy array of shape (N,t) from the last E step.
+    - np_rand (np.random.RandomState): The random generator of the run.
+    """
+    rand_name, rand_keys, rand_pos, rand_has_gauss, rand_gauss = np_rand.get_state()
+
+    tmp_fname = f"{fname}.tmp"
+    with open(tmp_fname, 'wb') as ckfh:
+        np.savez(ckfh, shape=np.array(X.shape), checksum=np.array(data_checksum(X)), seed=np.array(seed),
+                 iteration=np.array(iteration), log_pi=log_pi, log_P=log_P, log_W=log_W,
+                 rand_name=np.array(rand_name), rand_keys=rand_keys, rand_pos=np.array(rand_pos),
+                 rand_has_gauss=np.array(rand_has_gauss), rand_gauss=np.array(rand_gauss))
+        ckfh.flush()
+        os.fsync(ckfh.fileno())
+
+    os.replace(tmp_fname, fname)
+
+
+def load_checkpoint(fname: str, X: np.ndarray, topics: int, seed: int) -> \
+        tuple[int, np.ndarray, np.ndarray, np.ndarray, tuple]:
+    """
+    Load the state of an EM run saved by save_checkpoint.
+
+    Parameters:
+    - fname (str): The name of the checkpoint file.
+    - X (np.ndarray): A numpy array of shape (N,d) where N is the number of documents and d is the number of words.
+    - topics (int): The number of topics for clustering.
+    - seed (int): Seed for random generation.
+
+    Returns:
+    - iteration (int): The number of completed iterations.
+    - log_pi (np.ndarray): A numpy array of shape (t,1) where t is the number of topics for clustering.
+    - log_P (np.ndarray): A numpy array of shape (t,d) where t is the number of topics for clustering.
+    - log_W (np.ndarray): A numpy array of shape (N,t) from the last E step.
+    - rand_state (tuple): State of the random generator for np.random.RandomState.set_state.
+
+    Raises:
+    - ValueError: If the checkpoint was saved for different data, topics or seed.
+    """
+    with np.load(fname) as ckpt:
+        if tuple(ckpt['shape']) != X.shape or int(ckpt['checksum']) != data_checksum(X):
+            raise ValueError(f"{fname} was saved for a different document/word matrix")
+        if ckpt['log_pi'].shape[0] != topics or int(ckpt['seed']) != seed:
+            raise ValueError(f"{fname} was saved for a different number of topics or seed")
+
+        rand_state = (str(ckpt['rand_name']), ckpt['rand_keys'], int(ckpt['rand_pos']),
+                      int(ckpt['rand_has_gauss']), float(ckpt['rand_gauss']))
+
+        return int(ckpt['iteration']), ckpt['log_pi'], ckpt['log_P'], ckpt['log_W'], rand_state
+
+
+def run(X: np.ndarray, topics: int, iterations: int = 100, seed: int = 12345, debug: bool = False,
+        checkpoint_path: str = None, checkpoint_interval: int = 0, resume: bool = False) -> \
         tuple[np.ndarray, np.ndarray, np.ndarray]:
     """
     Run the expectation maximization algorithm for topic modeling.
 
+    With a checkpoint_path, the state is checkpointed every checkpoint_interval iterations (and once
+    finished). Resuming from a checkpoint gives results bit-identical to an uninterrupted run; a
+    missing checkpoint file starts from scratch.
+
     Parameters:
     - X (np.ndarray): A numpy array of shape (N,d) where N is the number of documents and d is the number of words.
     - topics (int): The number of topics for clustering.
     - iterations (int): The number of iterations.
     - seed (int): Seed for random generation.
     - debug (bool): Flag to print debug information.
+    - checkpoint_path (str): The name of the checkpoint file. Defaults to None (no checkpoints).
+    - checkpoint_interval (int): Iterations between checkpoints (0 only checkpoints when finished). Defaults to 0.
+    - resume (bool): Whether to resume from the checkpoint file if it exists. Defaults to False.
 
     Returns:
     - log_pi (np.ndarray): A numpy array of shape (t,1) where t is the number of topics for clustering.
@@ -116,6 +201,9 @@ def run(X: np.ndarray, topics: int, iterations: int = 100, seed: int = 12345, de
     the number of words.
     - log_W (np.ndarray): A numpy array of shape (N,t) where N is the number of documents and t is the number of topics
     for clustering.
+
+    Raises:
+    - ValueError: If the checkpoint to resume from does not match this run.
     """
     N, d = X.shape
 
@@ -128,11 +216,21 @@ def run(X: np.ndarray, topics: int, iterations: int = 100, seed: int = 12345, de
     log_P = np.log(P_init)
 
     log_W = None
+    start = 0
+
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        start, log_pi, log_P, log_W, rand_state = load_checkpoint(checkpoint_path, X, topics, seed)
+        if start > iterations:
+            raise ValueError(f"{checkpoint_path} is already past {iterations} iterations")
+        np_rand.set_state(rand_state)
+
+        if debug:
+            sys.stderr.write(f'.run resumed at iteration {start}')
 
     if debug:
         sys.stderr.write('.run started')
 
-    for iteration in range(iterations):
+    for iteration in range(start, iterations):
         if debug:
             sys.stderr.write('.')
 
@@ -143,6 +241,12 @@ def run(X: np.ndarray, topics: int, iterations: int = 100, seed: int = 12345, de
         log_P = update_logP(X, log_W)
         log_pi = update_log_pi(log_W)
 
+        if checkpoint_path is not None and checkpoint_interval > 0 and (iteration + 1) % checkpoint_interval == 0:
+            save_checkpoint(checkpoint_path, X, seed, iteration + 1, log_pi, log_P, log_W, np_rand)
+
+    if checkpoint_path is not None and log_W is not None:
+        save_checkpoint(checkpoint_path, X, seed, iterations, log_pi, log_P, log_W, np_rand)
+
     if debug:
         sys.stderr.write('run finished.\n')
 
@@ -0,0 +1,177 @@
+import numpy as np
+from typing import Any, Dict, List, Tuple
+
+MINUTES_PER_HOUR = 60
+MINUTES_PER_DAY = 1440
+HOURS_PER_DAY = 24
+
+# durations are packed into the low bits of a (start hour, duration) key so
+# that a single sorted array answers "events starting at hour h lasting at
+# least D minutes" with two binary searches
+HOUR_KEY_SHIFT = 32
+HOUR_KEY_DUR_MAX = (1 << HOUR_KEY_SHIFT) - 1
+
+
+def dp_to_minutes(dp: np.ndarray) -> np.ndarray:
+    """
+    Convert HHMM datapoints (as stored in 'start_dp'/'end_dp') to minutes of the day.
+
+    Parameters:
+    - dp (np.ndarray): Array of HHMM integers.
+
+    Returns:
+    - np.ndarray: Array of minutes since midnight.
+    """
+    return (dp // 100) * MINUTES_PER_HOUR + dp % 100
+
+
+def build_interval_index(metadata: List[List[Dict[str, Any]]]) -> Dict[str, np.ndarray]:
+    """
+    Build a sorted-array interval index over the historical events in metadata.
+
+    Every event is laid out on a 24 hour clock from its 'start_dp' and 'dur_dp'
+    fields. Events lasting a day or more are counted separately, since they
+    overlap any window, and events without any duration occupy no time and never
+    overlap a window.
+
+    Windows only start on the hour, so for each of the 24 hours the events under
+    way at that hour (started earlier, wrapping past midnight if need be) are kept
+    as sorted offsets from their start to the hour. The index takes O(n) memory
+    per hour an event spans on average, at most 24 * n.
+
+    Parameters:
+    - metadata (List[List[Dict[str, Any]]]): Metadata containing start_dp, dur_dp, etc.
+
+    Returns:
+    - Dict[str, np.ndarray]: The index arrays:
+      'starts': sorted event start minutes of the day,
+      'underway_offsets': per hour, sorted minutes from the hour forward to the start of
+      every event under way at the hour (the hour's slice starts at 'underway_ptr'),
+      'hour_durs': sorted (start hour, duration) keys,
+      'full_day': count of events lasting a whole day or more.
+    """
+    start_dp = np.fromiter(
+        (rec['start_dp'] for grouping in metadata for rec in grouping), dtype=np.int64
+    )
+    durs = np.fromiter(
+        (rec['dur_dp'] for grouping in metadata for rec in grouping), dtype=np.int64
+    )
+    durs = np.clip(durs, 0, None)
+
+    starts = dp_to_minutes(start_dp)
+
+    full_day = durs >= MINUTES_PER_DAY
+    part = ~full_day & (durs > 0)
+
+    # an event is under way at an hour when the hour lies strictly inside it, i.e. going
+    # forward from the hour its start comes after the rest of the day has passed it by
+    underway_offsets = []
+    for hour in range(HOURS_PER_DAY):
+        offsets = (starts[part] - hour * MINUTES_PER_HOUR) % MINUTES_PER_DAY
+        underway = (offsets > 0) & (offsets + durs[part] > MINUTES_PER_DAY)
+        underway_offsets.append(np.sort(offsets[underway]))
+
+    underway_ptr = np.cumsum([0] + [len(offsets) for offsets in underway_offsets])
+
+    hour_durs = (starts // MINUTES_PER_HOUR << HOUR_KEY_SHIFT) | np.minimum(durs, HOUR_KEY_DUR_MAX)
+
+    return {
+        'starts': np.sort(starts[part]),
+        'underway_offsets': np.concatenate(underway_offsets).astype(np.int64),
+        'underway_ptr': underway_ptr.astype(np.int64),
+        'hour_durs': np.sort(hour_durs),
+        'full_day': np.array(np.count_nonzero(full_day)),
+    }
+
+
+def count_starts(index: Dict[str, np.ndarray], win_start: int, win_end: int) -> int:
+    """
+    Count the events starting within a window that does not cross midnight.
+
+    Parameters:
+    - index (Dict[str, np.ndarray]): Index from build_interval_index.
+    - win_start (int): Window start in minutes of the day.
+    - win_end (int): Window end in minutes of the day.
+
+    Returns:
+    - int: Number of events starting in [win_start, win_end).
+    """
+    return int(np.searchsorted(index['starts'], win_end, side='left') -
+               np.searchsorted(index['starts'], win_start, side='left'))
+
+
+def window_overlap(index: Dict[str, np.ndarray], hour: int, duration: int) -> int:
+    """
+    Count the historical events overlapping a window starting at hour for duration minutes.
+
+    On a 24 hour clock, an event overlaps the window when it starts within the window, or
+    when it is under way at the window start having started outside the window (its start
+    lies at least duration minutes forward from the hour). Both are binary searches, so a
+    call takes O(log n).
+
+    Parameters:
+    - index (Dict[str, np.ndarray]): Index from build_interval_index.
+    - hour (int): Start hour of the window.
+    - duration (int): Duration of the window in minutes.
+
+    Returns:
+    - int: Number of historical events overlapping the window.
+    """
+    full_day = int(index['full_day'])
+    if duration >= MINUTES_PER_DAY:
+        return full_day + len(index['starts'])
+
+    hour = int(hour) % HOURS_PER_DAY
+    win_start = hour * MINUTES_PER_HOUR
+    win_dur = max(int(duration), 1)
+    win_end = win_start + win_dur
+
+    if win_end <= MINUTES_PER_DAY:
+        started = count_starts(index, win_start, win_end)
+    else:
+        started = count_starts(index, win_start, MINUTES_PER_DAY) + \
+            count_starts(index, 0, win_end - MINUTES_PER_DAY)
+
+    lo, hi = int(index['underway_ptr'][hour]), int(index['underway_ptr'][hour + 1])
+    underway = hi - int(np.searchsorted(index['underway_offsets'][lo:hi], win_dur, side='left')) - lo
+
+    return full_day + started + underway
+
+
+def window_fit(index: Dict[str, np.ndarray], hour: int, duration: int) -> float:
+    """
+    Fraction of historical events starting at hour that ran for at least duration minutes.
+
+    Parameters:
+    - index (Dict[str, np.ndarray]): Index from build_interval_index.
+    - hour (int): Start hour of the window.
+    - duration (int): Duration of the window in minutes.
+
+    Returns:
+    - float: The fit ratio (0.0 when no event has started at that hour).
+    """
+    hour_key = int(hour) << HOUR_KEY_SHIFT
+    hour_durs = index['hour_durs']
+
+    lo = np.searchsorted(hour_durs, hour_key, side='left')
+    hi = np.searchsorted(hour_durs, hour_key + HOUR_KEY_DUR_MAX, side='right')
+    if hi == lo:
+        return 0.0
+
+    fits = hi - np.searchsorted(hour_durs, hour_key + min(max(int(duration), 0), HOUR_KEY_DUR_MAX), side='left')
+    return float(fits / (hi - lo))
+
+
+def score_window(index: Dict[str, np.ndarray], hour: int, duration: int) -> Tuple[float, int]:
+    """
+    Score a suggested hour against the requested duration.
+
+    Parameters:
+    - index (Dict[str, np.ndarray]): Index from build_interval_index.
+    - hour (int): Suggested start hour.
+    - duration (int): Requested duration in minutes.
+
+    Returns:
+    - Tuple[float, int]: The fit ratio and the historical overlap count of the window.
+    """
+    return window_fit(index, hour, duration), window_overlap(index, hour, duration)
@@ -1,91 +1,347 @@
-from gensim import corpora
-from gensim.models import LdaModel, LsiModel
-from gensim.models.coherencemodel import CoherenceModel
-
-
-def lda(metadata, n_topics, new_tokens):
-    """
-    Perform Latent Dirichlet Allocation (LDA) on the given metadata.
-
-    Parameters:
-    - metadata (list): Metadata
-    - n_topics (int): The number of topics to discover in metadata
-    - new_tokens (list): Tokenized representation of a new request for topic prediction.
-
-    Returns:
-    tuple: A tuple containing three elements:
-        1. lda_pi (list): Topic probability distribution for the new maintenance request.
-        2. lda_P (list): Probabilities of words given topics.
-        3. coherence_scores (dict): Coherence scores for different metrics (u_mass, c_v, c_uci, c_npmi).
-    """
-    tokens = [d["tokens"] for elem in metadata for d in elem]
-    dictionary = corpora.Dictionary(tokens)
-    corpus = [dictionary.doc2bow(token) for token in tokens]
-    new_token_corpus = dictionary.doc2bow(new_tokens)
-
-    lda_model = LdaModel(corpus, num_topics=n_topics, id2word=dictionary)
-    lda_pi = lda_model[new_token_corpus]  # get topic probability distribution for a new maintenance request
-    lda_pi = [elem[1] for elem in lda_pi]
-    lda_P = lda_model.get_topics()  # probabilities of words given topics
-
-    coherence_scores = get_coherence_scores(lda_model, tokens, dictionary)
-
-    return lda_pi, lda_P, coherence_scores
-
-
-def lsa(metadata, n_topics, new_tokens):
-    """
-    Perform Latent Semantic Analysis (LSA) on the given metadata.
-
-    Parameters:
-    - metadata (list): Metadata
-    - n_topics (int): The number of topics to discover in metadata
-    - new_tokens (list): Tokenized representation of a new maintenance request
-
-    Returns:
-    tuple: A tuple containing two elements:
-        1. term_contributions (list): List of words defining the dominant topic and their contributions.
-        2. coherence_scores (dict): Coherence scores for different metrics (u_mass, c_v, c_uci, c_npmi).
-    """
-    tokens = [d["tokens"] for elem in metadata for d in elem]
-    dictionary = corpora.Dictionary(tokens)
-    # Converting list of documents into Document Term Matrix using dictionary prepared above
-    doc_term_matrix = [dictionary.doc2bow(token) for token in tokens]
-
-    lsa_model = LsiModel(doc_term_matrix, num_topics=n_topics, id2word=dictionary)
-
-    new_token_corpus = dictionary.doc2bow(new_tokens)
-
-    lsa_output = lsa_model[new_token_corpus]  # get the underlying topics coefficients for the new maintenance request
-    # Find the dominant topic - the element with the greatest absolute value
-    main_topic_number, _ = max(lsa_output, key=lambda x: abs(x[1]))
-
-    # Get the list of words that define the dominant topic along with their contribution
-    term_contributions = lsa_model.get_topics()[main_topic_number]  # lsa_model.show_topic(main_topic_number)
-
-    coherence_scores = get_coherence_scores(lsa_model, tokens, dictionary)
-
-    return term_contributions, coherence_scores
-
-
-def get_coherence_scores(model, tokens, dictionary):
-    """
-    Calculate coherence scores for a given topic modeling model.
-
-    Parameters:
-    - model: The topic modeling model (LDA or LSA).
-    - tokens (list): Tokenized representation of documents.
-    - dictionary: Gensim dictionary object.
-
-    Returns:
-    dict: Coherence scores for different metrics (u_mass, c_v, c_uci, c_npmi).
-    """
-    coherence_metrics = ['u_mass', 'c_v', 'c_uci', 'c_npmi']
-    coherence_scores = {}
-
-    for coherence_metric in coherence_metrics:
-        coherence_model = CoherenceModel(model=model, texts=tokens, dictionary=dictionary,
-                                         coherence=coherence_metric)
-        score = coherence_model.get_coherence()
-        coherence_scores[coherence_metric] = score
-    return coherence_scores
+import numpy as np
+import scipy.sparse as sp
+
+# gensim is imported where it is used: importing it dominates process startup,
+# which EM-only and cached queries never need to pay for
+
+GENSIM_METHODS = ('lda', 'lsa')
+
+
+def preload_gensim():
+    """
+    Import every gensim module used here up front, e.g. so a benchmark doesn't time the import as a fit.
+    """
+    from gensim import corpora
+    from gensim.models import LdaModel, LsiModel
+    from gensim.models.coherencemodel import CoherenceModel
+
+
+def build_corpus(metadata):
+    """
+    Build the gensim dictionary and bag-of-words corpus from the given metadata.
+
+    Parameters:
+    - metadata (list): Metadata
+
+    Returns:
+    tuple: A tuple containing three elements:
+        1. tokens (list): Tokenized representation of documents.
+        2. dictionary: Gensim dictionary object.
+        3. corpus (list): Bag-of-words representation of documents.
+    """
+    from gensim import corpora
+
+    tokens = [d["tokens"] for elem in metadata for d in elem]
+    dictionary = corpora.Dictionary(tokens)
+    corpus = [dictionary.doc2bow(token) for token in tokens]
+
+    return tokens, dictionary, corpus
+
+
+def align_topic_terms(topic_terms, dictionary, ordered_tokens):
+    """
+    Reorder the word columns of topic term weights from gensim dictionary ids to ordered_tokens.
+
+    Parameters:
+    - topic_terms (np.ndarray): Term weights indexed by gensim dictionary id (last axis).
+    - dictionary: Gensim dictionary object.
+    - ordered_tokens (list): Ordered list of tokens to align the columns to.
+
+    Returns:
+    np.ndarray: Term weights indexed by position in ordered_tokens (0 for unknown tokens).
+    """
+    token_ids = np.array([dictionary.token2id.get(token, -1) for token in ordered_tokens], dtype=np.int64)
+    aligned = np.zeros(topic_terms.shape[:-1] + (len(ordered_tokens),), dtype=topic_terms.dtype)
+    known = token_ids >= 0
+    aligned[..., known] = topic_terms[..., token_ids[known]]
+
+    return aligned
+
+
+def lda_fit(metadata, n_topics):
+    """
+    Train a Latent Dirichlet Allocation (LDA) model on the given metadata.
+
+    Parameters:
+    - metadata (list): Metadata
+    - n_topics (int): The number of topics to discover in metadata
+
+    Returns:
+    tuple: A tuple containing three elements:
+        1. lda_model: The trained gensim LdaModel.
+        2. dictionary: Gensim dictionary object.
+        3. tokens (list): Tokenized representation of documents.
+    """
+    from gensim.models import LdaModel
+
+    tokens, dictionary, corpus = build_corpus(metadata)
+    lda_model = LdaModel(corpus, num_topics=n_topics, id2word=dictionary)
+
+    return lda_model, dictionary, tokens
+
+
+def lda_query(lda_model, dictionary, new_tokens, ordered_tokens=None):
+    """
+    Get the topic distribution of a new maintenance request from a trained LDA model.
+
+    Parameters:
+    - lda_model: The trained gensim LdaModel.
+    - dictionary: Gensim dictionary object.
+    - new_tokens (list): Tokenized representation of a new request for topic prediction.
+    - ordered_tokens (list): Ordered list of tokens to align word columns to. Defaults to None (gensim ids).
+
+    Returns:
+    tuple: A tuple containing two elements:
+        1. lda_pi (list): Topic probability distribution for the new maintenance request.
+        2. lda_P (np.ndarray): Probabilities of words given topics.
+    """
+    new_token_corpus = dictionary.doc2bow(new_tokens)
+
+    # get topic probability distribution for a new maintenance request; every
+    # topic is kept so that positions line up with the rows of lda_P
+    lda_pi = lda_model.get_document_topics(new_token_corpus, minimum_probability=0.0)
+    lda_pi = [elem[1] for elem in lda_pi]
+    lda_P = lda_model.get_topics()  # probabilities of words given topics
+
+    if ordered_tokens is not None:
+        lda_P = align_topic_terms(lda_P, dictionary, ordered_tokens)
+
+    return lda_pi, lda_P
+
+
+def lda(metadata, n_topics, new_tokens, ordered_tokens=None):
+    """
+    Perform Latent Dirichlet Allocation (LDA) on the given metadata.
+
+    Parameters:
+    - metadata (list): Metadata
+    - n_topics (int): The number of topics to discover in metadata
+    - new_tokens (list): Tokenized representation of a new request for topic prediction.
+    - ordered_tokens (list): Ordered list of tokens to align word columns to. Defaults to None (gensim ids).
+
+    Returns:
+    tuple: A tuple containing three elements:
+        1. lda_pi (list): Topic probability distribution for the new maintenance request.
+        2. lda_P (list): Probabilities of words given topics.
+        3. coherence_scores (dict): Coherence scores for different metrics (u_mass, c_v, c_uci, c_npmi).
+    """
+    lda_model, dictionary, tokens = lda_fit(metadata, n_topics)
+    lda_pi, lda_P = lda_query(lda_model, dictionary, new_tokens, ordered_tokens)
+
+    coherence_scores = get_coherence_scores(lda_model, tokens, dictionary)
+
+    return lda_pi, lda_P, coherence_scores
+
+
+def lsa_fit(metadata, n_topics):
+    """
+    Train a Latent Semantic Analysis (LSA) model on the given metadata.
+
+    Parameters:
+    - metadata (list): Metadata
+    - n_topics (int): The number of topics to discover in metadata
+
+    Returns:
+    tuple: A tuple containing three elements:
+        1. lsa_model: The trained gensim LsiModel.
+        2. dictionary: Gensim dictionary object.
+        3. tokens (list): Tokenized representation of documents.
+    """
+    from gensim.models import LsiModel
+
+    # Converting list of documents into Document Term Matrix using dictionary prepared above
+    tokens, dictionary, doc_term_matrix = build_corpus(metadata)
+    lsa_model = LsiModel(doc_term_matrix, num_topics=n_topics, id2word=dictionary)
+
+    return lsa_model, dictionary, tokens
+
+
+def lsa_query(lsa_model, dictionary, new_tokens, ordered_tokens=None):
+    """
+    Get the term contributions of the dominant topic of a new maintenance request from a trained LSA model.
+
+    Parameters:
+    - lsa_model: The trained gensim LsiModel.
+    - dictionary: Gensim dictionary object.
+    - new_tokens (list): Tokenized representation of a new maintenance request
+    - ordered_tokens (list): Ordered list of tokens to align word columns to. Defaults to None (gensim ids).
+
+    Returns:
+    np.ndarray: Words defining the dominant topic and their contributions.
+    """
+    new_token_corpus = dictionary.doc2bow(new_tokens)
+
+    lsa_output = lsa_model[new_token_corpus]  # get the underlying topics coefficients for the new maintenance request
+    # Find the dominant topic - the element with the greatest absolute value
+    # (no known tokens in the request falls back to the first topic)
+    main_topic_number, _ = max(lsa_output, key=lambda x: abs(x[1]), default=(0, 0.0))
+
+    # Get the list of words that define the dominant topic along with their contribution
+    term_contributions = lsa_model.get_topics()[main_topic_number]  # lsa_model.show_topic(main_topic_number)
+
+    if ordered_tokens is not None:
+        term_contributions = align_topic_terms(term_contributions, dictionary, ordered_tokens)
+
+    return term_contributions
+
+
+def lsa(metadata, n_topics, new_tokens, ordered_tokens=None):
+    """
+    Perform Latent Semantic Analysis (LSA) on the given metadata.
+
+    Parameters:
+    - metadata (list): Metadata
+    - n_topics (int): The number of topics to discover in metadata
+    - new_tokens (list): Tokenized representation of a new maintenance request
+    - ordered_tokens (list): Ordered list of tokens to align word columns to. Defaults to None (gensim ids).
+
+    Returns:
+    tuple: A tuple containing two elements:
+        1. term_contributions (list): List of words defining the dominant topic and their contributions.
+        2. coherence_scores (dict): Coherence scores for different metrics (u_mass, c_v, c_uci, c_npmi).
+    """
+    lsa_model, dictionary, tokens = lsa_fit(metadata, n_topics)
+    term_contributions = lsa_query(lsa_model, dictionary, new_tokens, ordered_tokens)
+
+    coherence_scores = get_coherence_scores(lsa_model, tokens, dictionary)
+
+    return term_contributions, coherence_scores
+
+
+def tfidf_weights(X):
+    """
+    Compute the inverse document frequency weight of every word column of a count matrix.
+
+    Parameters:
+    - X (np.ndarray or scipy.sparse matrix): Count matrix of the shape (N,d).
+
+    Returns:
+    np.ndarray: Smoothed idf weights of the shape (d,).
+    """
+    N = X.shape[0]
+    df = np.asarray((X > 0).sum(axis=0)).ravel()
+
+    return np.log((1.0 + N) / (1.0 + df)) + 1.0
+
+
+def scale_columns(X, weights):
+    """
+    Scale the word columns of a (dense or sparse) count matrix.
+
+    Parameters:
+    - X (np.ndarray or scipy.sparse matrix): Count matrix of the shape (N,d).
+    - weights (np.ndarray): Column weights of the shape (d,).
+
+    Returns:
+    np.ndarray or scipy.sparse.csr_matrix: The scaled matrix.
+    """
+    if sp.issparse(X):
+        return sp.csr_matrix(X @ sp.diags(weights))
+    return X * weights
+
+
+def randomized_svd(A, n_components, n_oversamples=10, n_iter=4, seed=12345):
+    """
+    Truncated SVD by randomized range finding with power iterations (Halko, Martinsson, Tropp).
+
+    Parameters:
+    - A (np.ndarray or scipy.sparse matrix): Matrix of the shape (N,d).
+    - n_components (int): Number of singular triplets to keep.
+    - n_oversamples (int): Extra random projections for accuracy. Defaults to 10.
+    - n_iter (int): Power iterations for slowly decaying spectra. Defaults to 4.
+    - seed (int): Seed for random generation. Defaults to 12345.
+
+    Returns:
+    tuple: U of the shape (N,k), s of the shape (k,) and Vt of the shape (k,d).
+    """
+    N, d = A.shape
+    n_random = min(n_components + n_oversamples, N, d)
+
+    np_rand = np.random.RandomState(seed=seed)
+    Q = A @ np_rand.standard_normal((d, n_random))
+
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(Q)
+        Q, _ = np.linalg.qr(A.T @ Q)
+        Q = A @ Q
+
+    Q, _ = np.linalg.qr(Q)
+    B = (A.T @ Q).T
+    U_B, s, Vt = np.linalg.svd(B, full_matrices=False)
+    U = Q @ U_B
+
+    return U[:, :n_components], s[:n_components], Vt[:n_components]
+
+
+def lsa_rsvd_fit(X, n_topics, tfidf=True, seed=12345):
+    """
+    Train an LSA model by truncated randomized SVD directly on the count matrix.
+
+    Parameters:
+    - X (np.ndarray or scipy.sparse matrix): Count matrix of the shape (N,d).
+    - n_topics (int): The number of topics to discover.
+    - tfidf (bool): Whether to weight counts by inverse document frequency. Defaults to True.
+    - seed (int): Seed for random generation. Defaults to 12345.
+
+    Returns:
+    dict: Singular values 's', topic term weights 'Vt' of the shape (k,d) and word weights 'idf'
+    (ones without tfidf).
+    """
+    idf = tfidf_weights(X) if tfidf else np.ones(X.shape[1])
+    n_topics = min(n_topics, *X.shape)
+    _, s, Vt = randomized_svd(scale_columns(X, idf), n_topics, seed=seed)
+
+    return {'s': s, 'Vt': Vt, 'idf': idf}
+
+
+def lsa_rsvd_query(lsa_model, query_counts):
+    """
+    Get the term contributions of the dominant topic of a new maintenance request from a
+    randomized SVD LSA model, folding the request in by projection onto the topics.
+
+    Parameters:
+    - lsa_model (dict): Model from lsa_rsvd_fit.
+    - query_counts (np.ndarray): Word counts of the new maintenance request of the shape (d,).
+
+    Returns:
+    np.ndarray: Contributions of every word to the dominant topic, signed so that the topic
+    points the same way as the request.
+    """
+    s = lsa_model['s']
+    Vt = lsa_model['Vt']
+
+    # fold in: q_hat = S^-1 Vt q
+    nonzero = s > 0
+    q_hat = np.zeros(len(s))
+    q_hat[nonzero] = (Vt[nonzero] @ (query_counts * lsa_model['idf'])) / s[nonzero]
+
+    # Find the dominant topic - the element with the greatest absolute value
+    main_topic_number = int(np.argmax(np.abs(q_hat)))
+    sign = -1.0 if q_hat[main_topic_number] < 0 else 1.0
+
+    return sign * Vt[main_topic_number]
+
+
+def get_coherence_scores(model, tokens, dictionary):
+    """
+    Calculate coherence scores for a given topic modeling model.
+
+    Parameters:
+    - model: The topic modeling model (LDA or LSA).
+    - tokens (list): Tokenized representation of documents.
+    - dictionary: Gensim dictionary object.
+
+    Returns:
+    dict: Coherence scores for different metrics (u_mass, c_v, c_uci, c_npmi).
+    """
+    from gensim.models.coherencemodel import CoherenceModel
+
+    coherence_metrics = ['u_mass', 'c_v', 'c_uci', 'c_npmi']
+    coherence_scores = {}
+
+    for coherence_metric in coherence_metrics:
+        coherence_model = CoherenceModel(model=model, texts=tokens, dictionary=dictionary,
+                                         coherence=coherence_metric)
+        score = coherence_model.get_coherence()
+        coherence_scores[coherence_metric] = score
+    return coherence_scores
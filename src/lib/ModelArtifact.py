@@ -0,0 +1,233 @@
+import os
+import json
+import struct
+import numpy as np
+from typing import Any, Dict, List
+
+# layout: magic, little-endian uint64 header length, utf-8 json header, then
+# every array as raw C-ordered bytes at a 64 byte aligned offset, so that each
+# one can be memory mapped in place
+ARTIFACT_MAGIC = b'EMTMART1'
+ARTIFACT_VERSION = 3
+ARTIFACT_ALIGN = 64
+
+QUANTIZE_PRECISIONS = ['int8', 'float16', 'float32', 'float64']
+DEFAULT_QUANTIZE = 'int8'
+
+# int8 codes: INT8_FLOOR marks the EM eps floor (words never seen in the
+# topic), the other 255 codes span the row's useful range
+INT8_FLOOR = -128
+INT8_OFFSET = 127
+INT8_STEPS = 254
+
+
+def quantize_log_P_row(log_P_row: np.ndarray, precision: str = DEFAULT_QUANTIZE) -> Dict[str, np.ndarray]:
+    """
+    Quantize the log probabilities of words given the chosen topic.
+
+    EM floors every word never seen in a topic at the same log(eps) based value, far below
+    the rest of the row. With int8 that floor is kept exactly as a sentinel code and only the
+    useful range (from the smallest value above the floor up to the maximum) is scaled linearly.
+
+    Parameters:
+    - log_P_row (np.ndarray): A numpy array of the shape (d,) where d is the number of words.
+    - precision (str): One of QUANTIZE_PRECISIONS. Defaults to DEFAULT_QUANTIZE.
+
+    Returns:
+    - Dict[str, np.ndarray]: 'log_P' in the given precision, plus 'log_P_floor', 'log_P_min' and
+    'log_P_scale' for int8.
+    """
+    if precision != 'int8':
+        return {'log_P': log_P_row.astype(precision)}
+
+    log_P_floor = log_P_row.min()
+    useful = log_P_row > log_P_floor
+    log_P_min = log_P_row[useful].min() if np.any(useful) else log_P_floor
+    log_P_scale = (log_P_row.max() - log_P_min) / INT8_STEPS
+    if log_P_scale == 0:
+        log_P_scale = 1.0
+
+    quantized = np.rint((log_P_row - log_P_min) / log_P_scale) - INT8_OFFSET
+    quantized[~useful] = INT8_FLOOR
+
+    return {
+        'log_P': quantized.astype(np.int8),
+        'log_P_floor': np.array(log_P_floor),
+        'log_P_min': np.array(log_P_min),
+        'log_P_scale': np.array(log_P_scale),
+    }
+
+
+def dequantize_log_P_row(artifact: Dict[str, Any]) -> np.ndarray:
+    """
+    Restore the log probabilities of words given the chosen topic from an artifact.
+
+    Parameters:
+    - artifact (Dict[str, Any]): Artifact from load_artifact.
+
+    Returns:
+    - np.ndarray: The (approximate) log probabilities of the shape (d,) as float64.
+    """
+    arrays = artifact['arrays']
+    row = np.asarray(arrays['log_P'], dtype=np.float64)
+
+    if artifact['header']['quantize'] != 'int8':
+        return row
+
+    return np.where(arrays['log_P'] == INT8_FLOOR, float(arrays['log_P_floor']),
+                    (row + INT8_OFFSET) * float(arrays['log_P_scale']) + float(arrays['log_P_min']))
+
+
+def narrow_ints(array: np.ndarray) -> np.ndarray:
+    """
+    Store an integer array in the smallest of int16, int32 or int64 that holds its values.
+
+    Parameters:
+    - array (np.ndarray): The integer array.
+
+    Returns:
+    - np.ndarray: The array, narrowed where possible.
+    """
+    if array.size == 0:
+        return array
+
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if array.min() >= info.min and array.max() <= info.max:
+            return array.astype(dtype)
+
+    return array
+
+
+def hour_token_table(ordered_tokens: List[str], dt_token_group_counts: Dict[int, Dict[str, int]]) -> \
+        Dict[str, np.ndarray]:
+    """
+    Lay the token counts grouped by hours out as a sparse table, column (token) by column.
+
+    Parameters:
+    - ordered_tokens (List[str]): List of ordered tokens.
+    - dt_token_group_counts (Dict[int, Dict[str, int]]): Dictionary containing token counts grouped by hours.
+
+    Returns:
+    - Dict[str, np.ndarray]: 'hour_token_ptr' (d+1 offsets into the other two), 'hour_token_rows' (hour
+    rows, in the iteration order of dt_token_group_counts) and 'hour_token_counts'.
+    """
+    tokmap = {tok: idx for idx, tok in enumerate(ordered_tokens)}
+    cols = []
+    rows = []
+    counts = []
+
+    for row, tok_counts in enumerate(dt_token_group_counts.values()):
+        for tok, count in tok_counts.items():
+            cols.append(tokmap[tok])
+            rows.append(row)
+            counts.append(count)
+
+    cols = np.array(cols, dtype=np.int64)
+    order = np.argsort(cols, kind='stable')
+
+    return {
+        'hour_token_ptr': np.searchsorted(cols[order], np.arange(len(ordered_tokens) + 1)).astype(np.int32),
+        'hour_token_rows': np.array(rows, dtype=np.uint8)[order],
+        'hour_token_counts': narrow_ints(np.array(counts, dtype=np.int64)[order]),
+    }
+
+
+def token_group_counts(artifact: Dict[str, Any], tokens: List[str]) -> Dict[int, Dict[str, int]]:
+    """
+    Rebuild the token counts grouped by hours for the given tokens only.
+
+    Hours keep the iteration order of the trained model, so ties are broken the same way.
+
+    Parameters:
+    - artifact (Dict[str, Any]): Artifact from load_artifact.
+    - tokens (List[str]): The (query) tokens to rebuild counts for.
+
+    Returns:
+    - Dict[int, Dict[str, int]]: Dictionary containing token counts grouped by hours.
+    """
+    tokmap = artifact['tokmap']
+    arrays = artifact['arrays']
+    hours = artifact['header']['hours']
+
+    row_counts = {}
+    for tok in tokens:
+        if tok not in tokmap:
+            continue
+        lo, hi = arrays['hour_token_ptr'][tokmap[tok]:tokmap[tok] + 2]
+        for row, count in zip(arrays['hour_token_rows'][lo:hi].tolist(), arrays['hour_token_counts'][lo:hi].tolist()):
+            row_counts.setdefault(row, {})[tok] = count
+
+    return {hours[row]: row_counts[row] for row in sorted(row_counts)}
+
+
+def write_artifact(fname: str, header: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    """
+    Write a model artifact atomically (to a temporary file renamed into place).
+
+    Parameters:
+    - fname (str): The name of the artifact file.
+    - header (Dict[str, Any]): JSON serializable metadata (vocabulary, hour index, etc).
+    - arrays (Dict[str, np.ndarray]): The named arrays to store.
+    """
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+
+    header = {**header, 'version': ARTIFACT_VERSION, 'arrays': layout}
+    encoded = json.dumps(header).encode()
+    data_start = -(-(len(ARTIFACT_MAGIC) + 8 + len(encoded)) // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+
+    tmp_fname = f"{fname}.tmp"
+    with open(tmp_fname, 'wb') as artfh:
+        artfh.write(ARTIFACT_MAGIC)
+        artfh.write(struct.pack('<Q', len(encoded)))
+        artfh.write(encoded)
+        for name, array in arrays.items():
+            artfh.seek(data_start + layout[name]['offset'])
+            artfh.write(np.ascontiguousarray(array).tobytes())
+        artfh.truncate(data_start + offset)
+        artfh.flush()
+        os.fsync(artfh.fileno())
+
+    os.replace(tmp_fname, fname)
+
+
+def load_artifact(fname: str) -> Dict[str, Any]:
+    """
+    Load a model artifact, memory mapping its arrays.
+
+    Parameters:
+    - fname (str): The name of the artifact file.
+
+    Returns:
+    - Dict[str, Any]: The 'header', the memory mapped 'arrays' and 'tokmap' (token to column index).
+    """
+    with open(fname, 'rb') as artfh:
+        if artfh.read(len(ARTIFACT_MAGIC)) != ARTIFACT_MAGIC:
+            raise ValueError(f"{fname} is not a model artifact")
+        (header_len,) = struct.unpack('<Q', artfh.read(8))
+        header = json.loads(artfh.read(header_len).decode())
+
+    if header['version'] != ARTIFACT_VERSION:
+        raise ValueError(f"{fname} has unsupported artifact version {header['version']}")
+
+    data_start = -(-(len(ARTIFACT_MAGIC) + 8 + header_len) // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        shape = tuple(layout['shape'])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=layout['dtype'])
+            continue
+        # scalars are mapped as a single element and reshaped back
+        arrays[name] = np.memmap(fname, dtype=layout['dtype'], mode='r', offset=data_start + layout['offset'],
+                                 shape=shape or (1,)).reshape(shape)
+
+    return {
+        'header': header,
+        'arrays': arrays,
+        'tokmap': {tok: idx for idx, tok in enumerate(header['tokens'])},
+    }
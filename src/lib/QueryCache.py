@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Any, Dict, List
+
+# bump when the layout of cached suggestions (or how they are computed) changes
+CACHE_VERSION = 1
+DEFAULT_CACHE_MAX_SIZE = 16 * 1024 * 1024
+
+CACHE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS suggestions (
+         key TEXT PRIMARY KEY,
+         source TEXT NOT NULL,
+         value TEXT NOT NULL,
+         size INTEGER NOT NULL,
+         accessed REAL NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS suggestions_accessed ON suggestions (accessed)",
+]
+
+
+def hash_parts(*parts: Any) -> str:
+    """
+    Hash a sequence of JSON serializable parts into a hex digest.
+
+    Parameters:
+    - parts (Any): The parts to hash, in order.
+
+    Returns:
+    - str: The sha256 hex digest.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def source_fingerprint(fname: str) -> str:
+    """
+    Fingerprint a datasource file by its path, size and modification time.
+
+    Parameters:
+    - fname (str): The name of the datasource file.
+
+    Returns:
+    - str: The fingerprint, which changes whenever the datasource is regenerated or edited.
+    """
+    stat = os.stat(fname)
+    return hash_parts(CACHE_VERSION, os.path.realpath(fname), stat.st_size, stat.st_mtime_ns)
+
+
+def model_fingerprint(source_fp: str, params: Dict[str, Any]) -> str:
+    """
+    Fingerprint a model by its datasource and every parameter that changes its suggestions.
+
+    Parameters:
+    - source_fp (str): Fingerprint of the datasource from source_fingerprint.
+    - params (Dict[str, Any]): Model parameters (topics, iterations, duration, etc).
+
+    Returns:
+    - str: The model fingerprint.
+    """
+    return hash_parts(source_fp, params)
+
+
+def cache_key(model_fp: str, tokens: List[str], method: str) -> str:
+    """
+    Build the cache key of a query.
+
+    Token order is kept since suggestions weigh tokens by position.
+
+    Parameters:
+    - model_fp (str): Fingerprint of the model from model_fingerprint.
+    - tokens (List[str]): Normalized query tokens (from emtopic_tokens_from_event).
+    - method (str): Topic modeling algorithm.
+
+    Returns:
+    - str: The cache key.
+    """
+    return hash_parts(model_fp, list(tokens), method)
+
+
+def open_cache(fname: str, source_fp: str) -> sqlite3.Connection:
+    """
+    Open (creating if needed) the on-disk query cache, dropping entries of any other datasource.
+
+    Parameters:
+    - fname (str): The name of the cache file.
+    - source_fp (str): Fingerprint of the current datasource from source_fingerprint.
+
+    Returns:
+    - sqlite3.Connection: Connection to the cache.
+    """
+    conn = sqlite3.connect(fname)
+    with conn:
+        for statement in CACHE_SCHEMA:
+            conn.execute(statement)
+        conn.execute("DELETE FROM suggestions WHERE source != ?", (source_fp,))
+    return conn
+
+
+def get_cached(conn: sqlite3.Connection, key: str) -> Any:
+    """
+    Look up cached suggestions, marking them as most recently used.
+
+    Parameters:
+    - conn (sqlite3.Connection): Connection from open_cache.
+    - key (str): Cache key from cache_key.
+
+    Returns:
+    - Any: The cached suggestions, or None on a miss.
+    """
+    row = conn.execute("SELECT value FROM suggestions WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+
+    with conn:
+        conn.execute("UPDATE suggestions SET accessed = ? WHERE key = ?", (time.time(), key))
+    return json.loads(row[0])
+
+
+def put_cached(conn: sqlite3.Connection, key: str, source_fp: str, value: Any,
+               max_size: int = DEFAULT_CACHE_MAX_SIZE):
+    """
+    Store suggestions in the cache, evicting least recently used entries beyond max_size bytes.
+
+    Parameters:
+    - conn (sqlite3.Connection): Connection from open_cache.
+    - key (str): Cache key from cache_key.
+    - source_fp (str): Fingerprint of the current datasource from source_fingerprint.
+    - value (Any): JSON serializable suggestions (numpy scalars are converted).
+    - max_size (int): Maximum total size (in bytes) of cached values. Defaults to DEFAULT_CACHE_MAX_SIZE.
+    """
+    encoded = json.dumps(value, default=lambda obj: obj.item())
+
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO suggestions (key, source, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                     (key, source_fp, encoded, len(encoded), time.time()))
+
+        total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM suggestions").fetchone()[0]
+        if total_size <= max_size:
+            return
+
+        evict_size = 0
+        evict_keys = []
+        for lru_key, size in conn.execute("SELECT key, size FROM suggestions ORDER BY accessed"):
+            if total_size - evict_size <= max_size:
+                break
+            evict_keys.append((lru_key,))
+            evict_size += size
+
+        conn.executemany("DELETE FROM suggestions WHERE key = ?", evict_keys)
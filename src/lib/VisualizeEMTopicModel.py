@@ -1,7 +1,7 @@
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as pltcolors
-from matplotlib.font_manager import FontProperties
+
+# matplotlib is imported in viz_topic_freqs: importing it dominates process
+# startup, which only pays off when a plot is shown
 
 
 def get_top_topic_words_all(ordered_tokens: list[str], log_P: np.ndarray, N: int) -> list[list[str]]:
@@ -68,6 +68,9 @@ def viz_topic_freqs(ordered_tokens: list[str], log_pi: np.ndarray, log_P: np.nda
     - topic_idx (int): The index of the topic to visualize.
     - N (int): The number of top words to display for each topic.
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.font_manager import FontProperties
+
     plt.rcParams["figure.autolayout"] = True
 
     plt.rcParams["figure.figsize"] = [7.50, 3.50]
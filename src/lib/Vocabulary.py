@@ -0,0 +1,135 @@
+import zlib
+from typing import Any, Dict, List
+
+DEFAULT_MIN_DF = 1
+DEFAULT_MAX_DF = 1.0
+DEFAULT_HASH_BUCKETS = 0
+
+# corpus tokens are alphanumeric, so bucket names can never collide with them
+HASH_TOKEN_PREFIX = '#'
+
+
+def hash_token(token: str, hash_buckets: int) -> str:
+    """
+    Map a token to its feature hashing bucket.
+
+    A stable hash (crc32) is used since python's hash() of a str changes between processes.
+
+    Parameters:
+    - token (str): The token to hash.
+    - hash_buckets (int): The number of buckets.
+
+    Returns:
+    - str: The bucket name, e.g. '#42'.
+    """
+    return f"{HASH_TOKEN_PREFIX}{zlib.crc32(token.encode()) % hash_buckets}"
+
+
+def document_frequencies(metadata: List[List[Dict[str, Any]]]) -> Dict[str, int]:
+    """
+    Count the number of events (documents) every token appears in.
+
+    Parameters:
+    - metadata (List[List[Dict[str, Any]]]): Metadata containing tokens of every event.
+
+    Returns:
+    - Dict[str, int]: Document frequency of every token.
+    """
+    doc_freqs = {}
+    for grouping in metadata:
+        for record in grouping:
+            for tok in set(record['tokens']):
+                doc_freqs[tok] = doc_freqs.get(tok, 0) + 1
+
+    return doc_freqs
+
+
+def build_vocabulary(metadata: List[List[Dict[str, Any]]], min_df: int = DEFAULT_MIN_DF,
+                     max_df: float = DEFAULT_MAX_DF, hash_buckets: int = DEFAULT_HASH_BUCKETS) -> Dict[str, Any]:
+    """
+    Build the bounded vocabulary of the corpus.
+
+    Tokens in fewer than min_df events (e.g. one-off request ids) or in more than a max_df fraction
+    of the events are pruned. With hash_buckets > 0, the remaining tokens are hashed into that many
+    buckets, so the number of word columns stays fixed however large the corpus grows.
+
+    Parameters:
+    - metadata (List[List[Dict[str, Any]]]): Metadata containing tokens of every event.
+    - min_df (int): Minimum number of events a token appears in. Defaults to DEFAULT_MIN_DF.
+    - max_df (float): Maximum fraction of events a token appears in. Defaults to DEFAULT_MAX_DF.
+    - hash_buckets (int): Number of feature hashing buckets (0 disables hashing). Defaults to DEFAULT_HASH_BUCKETS.
+
+    Returns:
+    - Dict[str, Any]: The vocabulary: kept tokens 'keep' (None when nothing is pruned) and 'hash_buckets'.
+    """
+    keep = None
+
+    if min_df > 1 or max_df < 1.0:
+        num_docs = sum(len(grouping) for grouping in metadata)
+        max_count = max_df * num_docs
+        keep = {tok for tok, count in document_frequencies(metadata).items() if min_df <= count <= max_count}
+
+    return {'keep': keep, 'hash_buckets': hash_buckets}
+
+
+def map_tokens(vocab: Dict[str, Any], tokens: List[str]) -> List[str]:
+    """
+    Map tokens onto the vocabulary, dropping pruned tokens and hashing the rest if enabled.
+
+    Parameters:
+    - vocab (Dict[str, Any]): Vocabulary from build_vocabulary.
+    - tokens (List[str]): The tokens to map (order is kept).
+
+    Returns:
+    - List[str]: The mapped tokens.
+    """
+    if vocab['keep'] is not None:
+        tokens = [tok for tok in tokens if tok in vocab['keep']]
+
+    if vocab['hash_buckets'] > 0:
+        tokens = [hash_token(tok, vocab['hash_buckets']) for tok in tokens]
+
+    return tokens
+
+
+def token_names(vocab: Dict[str, Any], tokens: List[str]) -> Dict[str, str]:
+    """
+    Map every vocabulary token of a query back to the first query token it came from, for display.
+
+    Parameters:
+    - vocab (Dict[str, Any]): Vocabulary from build_vocabulary.
+    - tokens (List[str]): The unmapped query tokens.
+
+    Returns:
+    - Dict[str, str]: Query token of every mapped token.
+    """
+    names = {}
+    for tok in tokens:
+        for mapped in map_tokens(vocab, [tok]):
+            names.setdefault(mapped, tok)
+
+    return names
+
+
+def apply_vocabulary(vocab: Dict[str, Any], metadata: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+    """
+    Map the tokens of every event onto the vocabulary.
+
+    Events left without any token are dropped, since they no longer contribute to any word column.
+
+    Parameters:
+    - vocab (Dict[str, Any]): Vocabulary from build_vocabulary.
+    - metadata (List[List[Dict[str, Any]]]): Metadata containing tokens of every event.
+
+    Returns:
+    - List[List[Dict[str, Any]]]: Metadata with mapped tokens (records are copied, not modified).
+    """
+    if vocab['keep'] is None and vocab['hash_buckets'] == 0:
+        return metadata
+
+    mapped = []
+    for grouping in metadata:
+        records = [{**record, 'tokens': map_tokens(vocab, record['tokens'])} for record in grouping]
+        mapped.append([record for record in records if len(record['tokens']) > 0])
+
+    return mapped